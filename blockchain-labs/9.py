@@ -1,5 +1,6 @@
 import hashlib
 import time
+import mining
 
 class Block:
     def __init__(self, data, prev_hash, difficulty=2):
@@ -16,13 +17,10 @@ class Block:
 
     def mine_block(self):
         print(f"⛏️ Mining block with data: '{self.data}'...")
-        target = "0" * self.difficulty
-        while True:
-            hash_attempt = self.calculate_hash()
-            if hash_attempt.startswith(target):
-                print(f"✅ Block mined with nonce: {self.nonce}")
-                return hash_attempt
-            self.nonce += 1
+        self.nonce, hash_attempt = mining.mine(self.timestamp, self.data, self.prev_hash,
+                                               self.difficulty, self.nonce)
+        print(f"✅ Block mined with nonce: {self.nonce}")
+        return hash_attempt
 
 genesis = Block("Genesis Block", "0", difficulty=4)
 print("Genesis Hash:", genesis.hash)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import gc
+import importlib.util
+import inspect
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# Benchmarks the Block/Blockchain variants (8.py, 10.py, lab11, lab12, lab13)
+# on the same footing. Every variant gets a fixed clock, so block timestamps,
+# and therefore nonces and hash counts, are identical from run to run.
+#
+#   python bench_suite.py run -o results.json
+#   python bench_suite.py compare results.json baseline.json
+#
+# Difficulty is given as leading hex zeros (1-8, as in the lab UIs) and
+# converted to bits for the variants that take bits.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class FixedClock:
+    """Deterministic stand-in for time.time: start, start + step, ..."""
+
+    def __init__(self, start=1700000000.0, step=1.0):
+        self.now = start
+        self.step = step
+
+    def __call__(self):
+        t = self.now
+        self.now += self.step
+        return t
+
+def load(name, path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, path))
+    module = importlib.util.module_from_spec(spec)
+    # 8.py runs its demo on import
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+class Variant:
+    mines = True
+    hex_difficulty = False
+
+    def __init__(self, name, path):
+        self.name = name
+        self.module = load("bench_" + name, path)
+
+    def new_chain(self, difficulty):
+        if not self.mines:
+            return self.module.Blockchain()
+        return self.module.Blockchain(difficulty=difficulty if self.hex_difficulty else 4 * difficulty)
+
+    def hashes(self, block):
+        return block.nonce + 1 if self.mines else 1
+
+    def has_watermark(self, chain):
+        # 8.py, 10.py, lab12 and lab13 skip blocks they've already checked unless full=True
+        return hasattr(chain, "is_valid") and "full" in inspect.signature(chain.is_valid).parameters
+
+    def is_valid(self, chain, full=True):
+        if not hasattr(chain, "is_valid"):
+            return None
+        return chain.is_valid(full=full) if self.has_watermark(chain) else chain.is_valid()
+
+class Variant8(Variant):
+    mines = False
+
+class Variant13(Variant):
+    hex_difficulty = True
+
+VARIANTS = {
+    "8": lambda: Variant8("8", "8.py"),
+    "10": lambda: Variant("10", "10.py"),
+    "lab11": lambda: Variant("lab11", "lab11/blockchain.py"),
+    "lab12": lambda: Variant("lab12", "lab12/blockchain.py"),
+    "lab13": lambda: Variant13("lab13", "lab13/blockchain.py"),
+}
+
+def bench_mining(variant, difficulty, blocks):
+    variant.module.clock = FixedClock()
+    chain = variant.new_chain(difficulty)
+    start = time.perf_counter()
+    for i in range(blocks):
+        chain.add_block(f"block {i}")
+    elapsed = time.perf_counter() - start
+    hashes = sum(variant.hashes(b) for b in chain.chain[1:])
+    return {
+        'hashes_per_sec': hashes / elapsed if elapsed else None,
+        'seconds_per_block': elapsed / blocks,
+        'hashes_per_block': hashes / blocks,
+    }
+
+def build_chain(variant, size):
+    # Difficulty 0 accepts the first nonce, so building is one hash per block
+    variant.module.clock = FixedClock()
+    chain = variant.new_chain(0) if variant.mines else variant.new_chain(None)
+    for i in range(size - 1):
+        chain.add_block(f"block {i}")
+    return chain
+
+def bench_is_valid(variant, size, full=True):
+    """Time is_valid on a fresh chain: every block rehashed, or with full=False
+    only those past the verified watermark (none, on a chain built locally)"""
+    chain = build_chain(variant, size)
+    if not full and not variant.has_watermark(chain):
+        return None
+    start = time.perf_counter()
+    valid = variant.is_valid(chain, full)
+    elapsed = time.perf_counter() - start
+    if valid is None:
+        return None
+    return {'seconds': elapsed, 'valid': valid}
+
+def bench_memory(variant, size):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    chain = build_chain(variant, size)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del chain
+    return (after - before) / size
+
+def run(args):
+    results = {}
+    for name in args.variants:
+        variant = VARIANTS[name]()
+        print(f"== {name}", file=sys.stderr)
+        entry = {'mine': {}, 'is_valid': {}, 'is_valid_watermark': {}}
+        difficulties = args.difficulties if variant.mines else [0]
+        for d in difficulties:
+            entry['mine'][str(d)] = bench_mining(variant, d, args.blocks)
+            print(f"   mine d={d}: {entry['mine'][str(d)]['hashes_per_sec']:,.0f} H/s", file=sys.stderr)
+        for size in args.chain_sizes:
+            entry['is_valid'][str(size)] = bench_is_valid(variant, size)
+            entry['is_valid_watermark'][str(size)] = bench_is_valid(variant, size, full=False)
+        entry['bytes_per_block'] = bench_memory(variant, args.memory_blocks)
+        results[name] = entry
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'difficulties': args.difficulties,
+            'blocks': args.blocks,
+            'chain_sizes': args.chain_sizes,
+            'memory_blocks': args.memory_blocks,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+# name suffix -> True if a bigger number is better
+DIRECTION = {
+    'hashes_per_sec': True,
+    'seconds_per_block': False,
+    'seconds': False,
+    'bytes_per_block': False,
+}
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def compare(args):
+    with open(args.current) as f:
+        current = flatten(json.load(f)['results'])
+    with open(args.baseline) as f:
+        baseline = flatten(json.load(f)['results'])
+
+    regressions = 0
+    for key in sorted(current.keys() & baseline.keys()):
+        higher_is_better = DIRECTION.get(key.rsplit(".", 1)[-1])
+        old, new = baseline[key], current[key]
+        if higher_is_better is None or not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > args.tolerance else ""
+        regressions += bool(flag)
+        print(f"{key:45} {old:14.6g} -> {new:14.6g} {change:+8.1%} {flag}")
+    print(f"\n{regressions} regression(s) beyond {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+def int_list(text):
+    if "-" in text:
+        lo, hi = text.split("-")
+        return list(range(int(lo), int(hi) + 1))
+    return [int(x) for x in text.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Blockchain variant benchmark suite")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="run the benchmarks and write JSON")
+    p.add_argument("-o", "--output", help="write results here instead of stdout")
+    p.add_argument("--variants", type=lambda s: s.split(","), default=list(VARIANTS))
+    p.add_argument("--difficulties", type=int_list, default=int_list("1-5"),
+                   help="hex-zero difficulties, e.g. 1-8 or 1,3,5 (6+ takes minutes per block)")
+    p.add_argument("--blocks", type=int, default=5, help="blocks mined per difficulty")
+    p.add_argument("--chain-sizes", type=int_list, default=[1000, 100000])
+    p.add_argument("--memory-blocks", type=int, default=10000)
+
+    p = sub.add_parser("compare", help="flag regressions against a baseline")
+    p.add_argument("current")
+    p.add_argument("baseline")
+    p.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown, default 10%%")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+if __name__ == "__main__":
+    main()
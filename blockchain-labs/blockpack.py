@@ -0,0 +1,124 @@
+import struct
+
+# Compact block headers for the lab11/12/13 chains.
+#
+# A block's timestamp, prev_hash, hash and nonce live in one fixed-width
+# packed bytes object instead of a float, two 64-character hex strings and
+# an int, each with its own object overhead. Hashes are raw 32-byte digests
+# in there and only become hex at the edges: the hash/prev_hash properties,
+# to_dict and the templates. Genesis blocks point at prev_hash "0", which is
+# stored as 32 zero bytes.
+
+HEADER = struct.Struct("<d32s32sQ")  # timestamp, prev digest, digest, nonce
+NULL_DIGEST = bytes(32)
+
+def to_digest(hexhash):
+    return NULL_DIGEST if hexhash == "0" else bytes.fromhex(hexhash)
+
+def to_hex(digest):
+    return "0" if digest == NULL_DIGEST else digest.hex()
+
+class PackedHeader:
+    """Base for slotted blocks; subclasses add their payload slots"""
+
+    __slots__ = ("header",)
+
+    @classmethod
+    def from_record(cls, header, payload):
+        """Rebuild a block from its packed header and payload() dict"""
+        block = cls.__new__(cls)
+        block.header = header
+        for name, value in payload.items():
+            setattr(block, name, value)
+        return block
+
+    def set_header(self, timestamp, prev_hash, hash, nonce):
+        self.header = HEADER.pack(timestamp, to_digest(prev_hash), to_digest(hash), nonce)
+
+    def _field(self, i):
+        return HEADER.unpack(self.header)[i]
+
+    def _replace(self, i, value):
+        fields = list(HEADER.unpack(self.header)) if hasattr(self, "header") else [0.0, NULL_DIGEST, NULL_DIGEST, 0]
+        fields[i] = value
+        self.header = HEADER.pack(*fields)
+
+    @property
+    def timestamp(self):
+        return self._field(0)
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self._replace(0, value)
+
+    @property
+    def prev_digest(self):
+        return self._field(1)
+
+    @property
+    def prev_hash(self):
+        return to_hex(self._field(1))
+
+    @prev_hash.setter
+    def prev_hash(self, value):
+        self._replace(1, to_digest(value))
+
+    @property
+    def digest(self):
+        return self._field(2)
+
+    @property
+    def hash(self):
+        return to_hex(self._field(2))
+
+    @hash.setter
+    def hash(self, value):
+        self._replace(2, to_digest(value))
+
+    @property
+    def nonce(self):
+        return self._field(3)
+
+    @nonce.setter
+    def nonce(self, value):
+        self._replace(3, value)
+
+class SealedHeader(PackedHeader):
+    """PackedHeader that can't be changed once seal() is called.
+
+    Sealed blocks can be shared between chains (lab12/lab13 nodes); edits
+    build a new block instead, so copying one is a no-op. The digest is
+    cached at seal time, so every node's hash index can key on the same
+    bytes object.
+    """
+
+    __slots__ = ("_digest",)  # only set once sealed
+
+    @classmethod
+    def from_record(cls, header, payload):
+        return super().from_record(header, payload).seal()
+
+    def seal(self):
+        self._digest = self._field(2)
+        return self
+
+    @property
+    def digest(self):
+        try:
+            return self._digest
+        except AttributeError:
+            return self._field(2)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "_digest"):
+            raise AttributeError(f"{type(self).__name__} is immutable; build a new one instead")
+        object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (type(self).from_record, (self.header, self.payload()))
@@ -0,0 +1,171 @@
+import copy
+import json
+import mmap
+import os
+import struct
+import blockpack
+
+# On-disk chain format for the lab11/12/13 chains, read through mmap.
+#
+#   <path>      MAGIC, then one record per block: the packed blockpack
+#               header, a u32 payload length and the payload as JSON
+#   <path>.idx  one u64 record offset per block, so height -> record is O(1)
+#
+# Opening maps both files and reads nothing else. A Block is only built when
+# its height is indexed or iterated over. Indexed blocks are kept, so changes
+# made to them (e.g. a tamper) stay in memory until the chain is saved again;
+# iterating builds throwaway blocks for heights nobody has indexed.
+
+MAGIC = b"BCHAIN1\n"
+LENGTH = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+
+def _record(block):
+    payload = json.dumps(block.payload()).encode()
+    return block.header + LENGTH.pack(len(payload)) + payload
+
+def write_chain(path, blocks):
+    """Write blocks to path (and path.idx), replacing any chain file there"""
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f, open(tmp + ".idx", "wb") as idx:
+            f.write(MAGIC)
+            for block in blocks:
+                idx.write(OFFSET.pack(f.tell()))
+                f.write(_record(block))
+    except BaseException:
+        # e.g. a generator of blocks that failed verification part way
+        for name in (tmp, tmp + ".idx"):
+            if os.path.exists(name):
+                os.remove(name)
+        raise
+    os.replace(tmp + ".idx", path + ".idx")
+    os.replace(tmp, path)
+
+def _mmap(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class ChainFile:
+    """List-like, lazily loaded view of a chain file; supports append"""
+
+    def __init__(self, path, block_cls):
+        self.path = path
+        self.block_cls = block_cls
+        self.loaded = {}  # height -> Block handed out by indexing
+        self.data = self.index = None
+        self._map()
+        if self.data is None or self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a chain file")
+
+    def _map(self):
+        self.close()
+        self.data = _mmap(self.path)
+        self.index = _mmap(self.path + ".idx")
+        self.count = len(self.index) // OFFSET.size if self.index else 0
+
+    def close(self):
+        for m in (self.data, self.index):
+            if m is not None:
+                m.close()
+        self.data = self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _offset(self, height):
+        return OFFSET.unpack_from(self.index, height * OFFSET.size)[0]
+
+    def _build(self, height):
+        start = self._offset(height) + blockpack.HEADER.size
+        header = self.data[start - blockpack.HEADER.size:start]
+        n = LENGTH.unpack_from(self.data, start)[0]
+        payload = json.loads(self.data[start + LENGTH.size:start + LENGTH.size + n])
+        return self.block_cls.from_record(header, payload)
+
+    def __getitem__(self, height):
+        if isinstance(height, slice):
+            return [self[h] for h in range(*height.indices(self.count))]
+        if height < 0:
+            height += self.count
+        if not 0 <= height < self.count:
+            raise IndexError("block height out of range")
+        block = self.loaded.get(height)
+        if block is None:
+            block = self.loaded[height] = self._build(height)
+        return block
+
+    def __setitem__(self, height, block):
+        # Replaces the block in memory only, like edits to a loaded block
+        if height < 0:
+            height += self.count
+        if not 0 <= height < self.count:
+            raise IndexError("block height out of range")
+        self.loaded[height] = block
+
+    def __iter__(self):
+        for height in range(self.count):
+            block = self.loaded.get(height)
+            yield block if block is not None else self._build(height)
+
+    def digests(self, start=0):
+        """Each block's digest, straight from the mapped headers where not loaded"""
+        for height in range(start, self.count):
+            block = self.loaded.get(height)
+            if block is not None:
+                yield block.digest
+            else:
+                yield blockpack.HEADER.unpack_from(self.data, self._offset(height))[2]
+
+    def append(self, block):
+        with open(self.path, "ab") as f, open(self.path + ".idx", "ab") as idx:
+            idx.write(OFFSET.pack(f.seek(0, os.SEEK_END)))
+            f.write(_record(block))
+        self.loaded[self.count] = block
+        self._map()
+
+    def __deepcopy__(self, memo):
+        # Copying a file-backed chain gives a plain in-memory list
+        return [copy.deepcopy(block, memo) for block in self]
+
+class HeightIndex(dict):
+    """digest -> height for a ChainFile, only read from the file on first use"""
+
+    def __init__(self, chain):
+        super().__init__()
+        self.chain = chain
+        self.filled = False
+
+    def _fill(self):
+        if not self.filled:
+            self.filled = True
+            for height, digest in enumerate(self.chain.digests()):
+                dict.__setitem__(self, digest, height)
+
+    def get(self, key, default=None):
+        self._fill()
+        return super().get(key, default)
+
+    def __getitem__(self, key):
+        self._fill()
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self._fill()
+        return super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        self._fill()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._fill()
+        super().__delitem__(key)
@@ -1,61 +1,158 @@
-from flask import Flask, render_template, request, redirect, session
+from flask import Flask, stream_template, request, redirect, session, jsonify, abort
 from flask_session import Session
-from blockchain import Blockchain
+from blockchain import Blockchain, Block
+from jobs import MiningQueue
+from chainlog import ChainLog
+from chaindb import ChainDB
 import uuid
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import paging
+import mempool
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['SESSION_TYPE'] = 'filesystem'
+# Number of processes used to mine a block (1 = plain serial loop)
+app.config['MINING_WORKERS'] = int(os.environ.get('MINING_WORKERS', os.cpu_count() or 1))
+# Number of blocks mined at the same time in the background
+app.config['MINING_JOBS'] = int(os.environ.get('MINING_JOBS', 2))
+# Retarget every N blocks to aim for BLOCK_TIME seconds per block (0 = fixed target)
+app.config['RETARGET_INTERVAL'] = int(os.environ.get('RETARGET_INTERVAL', 5))
+app.config['BLOCK_TIME'] = float(os.environ.get('BLOCK_TIME', 10))
+# Where in-progress mines save their nonce so they survive a restart
+app.config['CHECKPOINT_DIR'] = os.environ.get('CHECKPOINT_DIR', os.path.join(app.root_path, 'checkpoints'))
+# Where chains are kept; the session only holds the user id.
+# 'log' = per-user append-only files in CHAIN_DIR (one process),
+# 'sqlite' = one shared database at CHAIN_DB (any number of worker processes)
+app.config['CHAIN_STORE'] = os.environ.get('CHAIN_STORE', 'log')
+app.config['CHAIN_DIR'] = os.environ.get('CHAIN_DIR', os.path.join(app.root_path, 'chains'))
+app.config['CHAIN_DB'] = os.environ.get('CHAIN_DB', os.path.join(app.root_path, 'chains.db'))
+# Seconds a user's /submit pool may sit empty before its thread is stopped
+# (batch sizes come from MEMPOOL_BLOCK/MEMPOOL_WAIT, see mempool.py)
+app.config['MEMPOOL_IDLE'] = float(os.environ.get('MEMPOOL_IDLE', 60))
 Session(app)
 
+if app.config['CHAIN_STORE'] == 'sqlite':
+    chain_store = ChainDB(app.config['CHAIN_DB'])
+else:
+    chain_store = ChainLog(app.config['CHAIN_DIR'])
+
+def commit_job(job):
+    """Put a block the queue has just mined into the user's chain, from whichever worker mined it.
+
+    False if it no longer extends the chain or isn't at the target the chain
+    needs next; the queue then mines it again.
+    """
+    # One batch, so checking the tip and appending can't interleave with another worker
+    with chain_store.batch():
+        blockchain = Blockchain.from_log(chain_store, job.user_id, workers=app.config['MINING_WORKERS'])
+        block = Block.from_dict(job.block)
+        if job.kind == "reset":
+            # Replaces the old chain with just the new genesis block
+            chain_store.reset(job.user_id, job.block, block.target,
+                              blockchain.retarget_interval, blockchain.block_time)
+        elif block.prev_digest == blockchain.chain[-1].digest and block.target == blockchain.target:
+            target = blockchain.target
+            blockchain.append_block(block)
+            if blockchain.target != target:
+                chain_store.set_target(job.user_id, blockchain.target)
+        else:
+            return False
+    return True
+
+def stored_tip(user_id):
+    """Hash of the user's last stored block and the target the next one must meet"""
+    blockchain = Blockchain.from_log(chain_store, user_id)
+    return blockchain.chain[-1].hash, blockchain.target
+
+# Jobs and their progress live in chain_store, so every worker process sees them
+mining_queue = MiningQueue(app.config['MINING_JOBS'], app.config['MINING_WORKERS'],
+                           app.config['CHECKPOINT_DIR'], on_done=commit_job, store=chain_store,
+                           tip=stored_tip)
+
+def queue_batch(user_id, entries):
+    # lab11 blocks hold one string, so a batch is joined like lab12/lab13 display theirs
+    mining_queue.add(user_id, " | ".join(entries), chain_store.state(user_id)['target'])
+
+# A pool per user turning /submit batches into mining jobs; idle ones are dropped
+pools = mempool.Pools(queue_batch, idle=app.config['MEMPOOL_IDLE'])
+
 def get_user_blockchain():
     """Get or create blockchain for current user session"""
     if 'user_id' not in session:
         session['user_id'] = str(uuid.uuid4())
-    
-    if 'blockchain' not in session:
+    user_id = session['user_id']
+
+    if 'blockchain' in session:
+        # Sessions from before the block log carry the whole chain; move it over once
+        old = Blockchain.from_dict(session.pop('blockchain'))
+        with chain_store.batch():
+            chain_store.reset(user_id, old.chain[0].to_dict(), old.target,
+                              old.retarget_interval, old.block_time)
+            chain_store.append_many(user_id, [block.to_dict() for block in old.chain[1:]])
+    elif not chain_store.exists(user_id):
         # Create new blockchain for this user
-        blockchain = Blockchain(difficulty=3)
-        session['blockchain'] = blockchain.to_dict()
-    else:
-        # Load existing blockchain from session
-        blockchain = Blockchain.from_dict(session['blockchain'])
-    
-    return blockchain
-
-def save_blockchain(blockchain):
-    """Save blockchain to session"""
-    session['blockchain'] = blockchain.to_dict()
+        new = Blockchain(difficulty=12, workers=app.config['MINING_WORKERS'],
+                         retarget_interval=app.config['RETARGET_INTERVAL'],
+                         block_time=app.config['BLOCK_TIME'])
+        chain_store.reset(user_id, new.chain[0].to_dict(), new.target,
+                          new.retarget_interval, new.block_time)
+
+    return Blockchain.from_log(chain_store, user_id, workers=app.config['MINING_WORKERS'])
 
 @app.route('/')
 def index():
     blockchain = get_user_blockchain()
-    chain = blockchain.get_chain()
-    return render_template('index.html', chain=chain, difficulty=blockchain.difficulty, user_id=session['user_id'])
+    # Newest page first; ?before=<height> pages back from there
+    page = paging.page(len(blockchain.chain), request.args.get('before', type=int))
+    blocks = paging.newest_first(blockchain, page)
+    jobs = mining_queue.status(session['user_id'])
+    return stream_template('index.html', blocks=blocks, page=page, difficulty=blockchain.difficulty, target=blockchain.target, user_id=session['user_id'], jobs=jobs,
+                           pending=pools.pending(session['user_id']))
 
 @app.route('/add', methods=['POST'])
 def add():
     blockchain = get_user_blockchain()
     data = request.form.get('data')
     if data:
-        blockchain.add_block(data)
-        save_blockchain(blockchain)
+        mining_queue.add(session['user_id'], data, blockchain.target)
     return redirect('/')
 
+@app.route('/submit', methods=['POST'])
+def submit():
+    """Queue entries for the next batched block and return at once"""
+    get_user_blockchain()
+    try:
+        entries, is_json = mempool.request_entries(request)
+    except ValueError as e:
+        abort(400, str(e))
+    accepted = pools.submit(session['user_id'], entries)
+    if not is_json:
+        return redirect('/')
+    return jsonify(accepted=accepted, pending=pools.pending(session['user_id'])), 202
+
 @app.route('/set_difficulty', methods=['POST'])
 def set_difficulty():
     blockchain = get_user_blockchain()
     try:
-        new_difficulty = int(request.form.get('difficulty', 3))
-        if new_difficulty < 1 or new_difficulty > 8:
-            new_difficulty = 3  # Default to 3 if invalid
-        blockchain.reset_chain(new_difficulty)
-        save_blockchain(blockchain)
+        new_difficulty = int(request.form.get('difficulty', 12))
+        if new_difficulty < 1 or new_difficulty > 32:
+            new_difficulty = 12  # Default to 12 bits if invalid
+        mining_queue.reset(session['user_id'], new_difficulty)
     except ValueError:
         # If conversion fails, keep current difficulty
         pass
     return redirect('/')
 
+@app.route('/status')
+def status():
+    """Progress of this user's background mining jobs"""
+    get_user_blockchain()
+    return jsonify(jobs=mining_queue.status(session['user_id']), pending=pools.pending(session['user_id']))
+
 @app.route('/new_session')
 def new_session():
     """Create a new session for the user"""
@@ -1,27 +1,41 @@
 import hashlib
 import time
 import json
+import os
+import sys
+from collections import deque
 
-class Block:
-    def __init__(self, data, prev_hash, difficulty=3):
-        self.timestamp = time.time()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mining
+import blockpack
+import chainfile
+
+# Source of block timestamps; benchmarks swap in a fixed clock
+clock = time.time
+
+class Block(blockpack.PackedHeader):
+    # timestamp, prev_hash, hash and nonce are packed into self.header
+    __slots__ = ("data", "target")
+
+    def __init__(self, data, prev_hash, target, workers=1):
+        self.set_header(clock(), prev_hash, "0", 0)
         self.data = data
-        self.prev_hash = prev_hash
-        self.nonce = 0
-        self.difficulty = difficulty
-        self.hash = self.mine_block()
+        self.target = target
+        self.hash = self.mine_block(workers)
+
+    @property
+    def difficulty(self):
+        """Difficulty in bits"""
+        return mining.target_bits(self.target)
 
     def calculate_hash(self):
         text = str(self.timestamp) + self.data + self.prev_hash + str(self.nonce)
         return hashlib.sha256(text.encode()).hexdigest()
 
-    def mine_block(self):
-        prefix = "0" * self.difficulty
-        while True:
-            h = self.calculate_hash()
-            if h.startswith(prefix):
-                return h
-            self.nonce += 1
+    def mine_block(self, workers=1):
+        self.nonce, h = mining.mine(self.timestamp, self.data, self.prev_hash,
+                                    start=self.nonce, workers=workers, target=self.target)
+        return h
 
     def to_dict(self):
         """Convert block to dictionary for serialization"""
@@ -30,50 +44,168 @@ class Block:
             'data': self.data,
             'prev_hash': self.prev_hash,
             'nonce': self.nonce,
-            'difficulty': self.difficulty,
+            'target': self.target,
             'hash': self.hash
         }
 
+    def payload(self):
+        """Everything but the header, for chain files"""
+        return {'data': self.data, 'target': self.target}
+
     @classmethod
     def from_dict(cls, data):
         """Create block from dictionary"""
         block = cls.__new__(cls)
-        block.timestamp = data['timestamp']
+        block.set_header(data['timestamp'], data['prev_hash'], data['hash'], data['nonce'])
         block.data = data['data']
-        block.prev_hash = data['prev_hash']
-        block.nonce = data['nonce']
-        block.difficulty = data['difficulty']
-        block.hash = data['hash']
+        block.target = _stored_target(data)
         return block
 
+def _verified(lines, retarget_interval=0, block_time=10):
+    """Blocks from JSON lines, checking each hash, target and link as it's read.
+
+    Only genesis picks its own target; every later block must carry the one
+    the retarget settings give it, as mining.next_target works it out.
+    """
+    prev = None
+    recent = deque(maxlen=retarget_interval + 1)  # the blocks next_target looks back over
+    for height, line in enumerate(lines):
+        block = Block.from_dict(json.loads(line))
+        if prev is not None:
+            expected = prev.target
+            if retarget_interval and height > retarget_interval and (height - 1) % retarget_interval == 0:
+                expected = mining.retarget(prev.target, prev.timestamp - recent[0].timestamp,
+                                           retarget_interval * block_time)
+            if block.target != expected:
+                raise ValueError(f"block {height}: target isn't the one the retarget settings give")
+        if block.hash != block.calculate_hash() or not mining.meets_target(block.hash, block.target):
+            raise ValueError(f"block {height}: bad hash")
+        if (prev.digest if prev else blockpack.NULL_DIGEST) != block.prev_digest:
+            raise ValueError(f"block {height}: doesn't link to block {height - 1}")
+        prev = block
+        recent.append(block)
+        yield block
+    if prev is None:
+        raise ValueError("no blocks after the settings line")
+
+def _stored_target(data):
+    # Sessions saved before targets existed only have a hex-zero difficulty
+    if 'target' in data:
+        return data['target']
+    return mining.bits_target(4 * data['difficulty'])
+
 class Blockchain:
-    def __init__(self, difficulty=3):
-        self.chain = [Block("Genesis Block", "0", difficulty)]
-        self.difficulty = difficulty
+    def __init__(self, difficulty=12, workers=1, retarget_interval=0, block_time=10):
+        """difficulty is in bits; retarget_interval=0 keeps the target fixed"""
+        self.workers = workers
+        self.retarget_interval = retarget_interval
+        self.block_time = block_time
+        self.target = mining.bits_target(difficulty)
+        self.chain = [Block("Genesis Block", "0", self.target, workers)]
+
+    @property
+    def difficulty(self):
+        """Difficulty in bits"""
+        return mining.target_bits(self.target)
 
     def add_block(self, data):
         prev_hash = self.chain[-1].hash
-        self.chain.append(Block(data, prev_hash, self.difficulty))
+        self.append_block(Block(data, prev_hash, self.target, self.workers))
+
+    def append_block(self, block):
+        """Append an already mined block and retarget if an interval just ended"""
+        self.chain.append(block)
+        self.target = mining.next_target(self.chain, self.target, self.retarget_interval, self.block_time)
 
     def reset_chain(self, new_difficulty):
         """Reset the blockchain with a new difficulty and clear all blocks except genesis"""
-        self.difficulty = new_difficulty
-        self.chain = [Block("Genesis Block", "0", new_difficulty)]
+        self.target = mining.bits_target(new_difficulty)
+        self.chain = [Block("Genesis Block", "0", self.target, self.workers)]
 
     def get_chain(self):
         return self.chain
 
+    def block_range(self, start, stop):
+        """Blocks at heights [start, stop), clamped to the chain"""
+        return self.chain[max(0, start):max(0, stop)]
+
     def to_dict(self):
         """Convert blockchain to dictionary for session storage"""
         return {
-            'difficulty': self.difficulty,
+            'target': self.target,
+            'retarget_interval': self.retarget_interval,
+            'block_time': self.block_time,
             'chain': [block.to_dict() for block in self.chain]
         }
 
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, workers=1):
         """Create blockchain from dictionary"""
         blockchain = cls.__new__(cls)
-        blockchain.difficulty = data['difficulty']
+        blockchain.workers = workers
+        blockchain.target = _stored_target(data)
+        blockchain.retarget_interval = data.get('retarget_interval', 0)
+        blockchain.block_time = data.get('block_time', 10)
         blockchain.chain = [Block.from_dict(block_data) for block_data in data['chain']]
-        return blockchain
\ No newline at end of file
+        return blockchain
+
+    @classmethod
+    def from_log(cls, log, user_id, workers=1):
+        """Blockchain over a user's ChainLog; blocks are read from disk on access"""
+        state = log.state(user_id)
+        blockchain = cls.__new__(cls)
+        blockchain.workers = workers
+        blockchain.target = state['target']
+        blockchain.retarget_interval = state['retarget_interval']
+        blockchain.block_time = state['block_time']
+        blockchain.chain = log.view(user_id, Block)
+        return blockchain
+
+    def save(self, path):
+        """Write the chain to a chain file (see chainfile.py)"""
+        chainfile.write_chain(path, self.chain)
+
+    @classmethod
+    def open(cls, path, workers=1, retarget_interval=0, block_time=10):
+        """Blockchain over a chain file; blocks are only read when they're used"""
+        blockchain = cls.__new__(cls)
+        blockchain.workers = workers
+        blockchain.retarget_interval = retarget_interval
+        blockchain.block_time = block_time
+        blockchain.chain = chainfile.ChainFile(path, Block)
+        blockchain.target = mining.next_target(blockchain.chain, blockchain.chain[-1].target,
+                                               retarget_interval, block_time)
+        return blockchain
+
+    def export_jsonl(self, f):
+        """Write the chain to f as JSON Lines: the settings, then one block per line"""
+        f.write(json.dumps({'target': self.target, 'retarget_interval': self.retarget_interval,
+                            'block_time': self.block_time}) + "\n")
+        for block in self.chain:
+            f.write(json.dumps(block.to_dict()) + "\n")
+
+    @classmethod
+    def import_jsonl(cls, f, path=None, workers=1):
+        """Read a chain written by export_jsonl, verifying it block by block.
+
+        With path, the blocks are streamed into a chain file there and the
+        chain is opened from it, so it never has to fit in memory.
+        """
+        lines = iter(f)
+        settings = json.loads(next(lines, "null"))
+        if not isinstance(settings, dict) or 'retarget_interval' not in settings or 'block_time' not in settings:
+            raise ValueError("missing settings line")
+        interval, block_time = settings['retarget_interval'], settings['block_time']
+        blocks = _verified(lines, interval, block_time)
+        if path is not None:
+            chainfile.write_chain(path, blocks)
+            return cls.open(path, workers, interval, block_time)
+        blockchain = cls.__new__(cls)
+        blockchain.workers = workers
+        blockchain.retarget_interval = interval
+        blockchain.block_time = block_time
+        blockchain.chain = list(blocks)
+        # Worked out from the blocks like open() does, not taken from the file
+        blockchain.target = mining.next_target(blockchain.chain, blockchain.chain[-1].target,
+                                               interval, block_time)
+        return blockchain
@@ -0,0 +1,192 @@
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import blockpack
+from chainlog import ChainView
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chains (
+    user_id TEXT PRIMARY KEY,
+    target TEXT NOT NULL,
+    retarget_interval INTEGER NOT NULL,
+    block_time REAL NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    user_id TEXT NOT NULL,
+    height INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    data TEXT NOT NULL,
+    prev_hash BLOB NOT NULL,
+    hash BLOB NOT NULL,
+    nonce INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    PRIMARY KEY (user_id, height)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    info TEXT NOT NULL
+);
+"""
+
+JOB_TIMEOUT = 30  # seconds without a heartbeat before a job's worker is taken to be gone
+
+class ChainDB:
+    """SQLite chain store with the same interface as ChainLog.
+
+    One database holds every user's chain, with block rows keyed by
+    (user_id, height), so any number of worker processes can share it.
+    WAL mode lets readers carry on while a writer commits. Connections come
+    from a small pool. Inside `with db.batch():` every call on this thread
+    uses one connection and one transaction, so a run of appends is a
+    single commit. Targets are stored as text (they don't fit in 64 bits)
+    and hashes as raw digests. The jobs table holds every worker's mining
+    jobs, so any worker can report them.
+    """
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self.pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self.pool.put(self._connect())
+        self.local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+
+    @contextmanager
+    def batch(self):
+        """Run everything inside on one connection and commit it as one transaction"""
+        if getattr(self.local, 'conn', None) is not None:
+            yield
+            return
+        with self._conn() as conn:
+            # IMMEDIATE takes the write lock up front, so a read-check-append
+            # (e.g. "does this block extend the tip?") can't race another worker
+            conn.execute("BEGIN IMMEDIATE")
+            self.local.conn = conn
+            try:
+                yield
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                self.local.conn = None
+
+    def exists(self, user_id):
+        with self._conn() as conn:
+            return conn.execute("SELECT 1 FROM chains WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def reset(self, user_id, genesis, target, retarget_interval, block_time):
+        """Start a new chain for the user, dropping the old blocks"""
+        with self.batch(), self._conn() as conn:
+            conn.execute("DELETE FROM blocks WHERE user_id = ?", (user_id,))
+            conn.execute("INSERT OR REPLACE INTO chains VALUES (?, ?, ?, ?, 0)",
+                         (user_id, str(target), retarget_interval, block_time))
+            self.append(user_id, genesis)
+
+    def append(self, user_id, block):
+        self.append_many(user_id, [block])
+
+    def append_many(self, user_id, blocks):
+        """Insert blocks after the user's tip with one executemany"""
+        with self.batch(), self._conn() as conn:
+            length = conn.execute("SELECT length FROM chains WHERE user_id = ?", (user_id,)).fetchone()[0]
+            conn.executemany("INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+                (user_id, length + i, b['timestamp'], b['data'], blockpack.to_digest(b['prev_hash']),
+                 blockpack.to_digest(b['hash']), b['nonce'], str(b['target']))
+                for i, b in enumerate(blocks)
+            ])
+            conn.execute("UPDATE chains SET length = ? WHERE user_id = ?", (length + len(blocks), user_id))
+
+    def set_target(self, user_id, target):
+        with self._conn() as conn:
+            conn.execute("UPDATE chains SET target = ? WHERE user_id = ?", (str(target), user_id))
+
+    def state(self, user_id):
+        """Chain settings, current target and block count"""
+        with self._conn() as conn:
+            target, retarget_interval, block_time, length = conn.execute(
+                "SELECT target, retarget_interval, block_time, length FROM chains WHERE user_id = ?",
+                (user_id,)).fetchone()
+        return {
+            'target': int(target),
+            'retarget_interval': retarget_interval,
+            'block_time': block_time,
+            'length': length
+        }
+
+    def blocks(self, user_id, start=0, stop=None):
+        """Block dicts for heights [start, stop)"""
+        start, stop, _ = slice(start, stop).indices(self.state(user_id)['length'])
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT timestamp, data, prev_hash, hash, nonce, target FROM blocks"
+                " WHERE user_id = ? AND height >= ? AND height < ? ORDER BY height",
+                (user_id, start, stop)).fetchall()
+        return [{
+            'timestamp': timestamp,
+            'data': data,
+            'prev_hash': blockpack.to_hex(prev_hash),
+            'nonce': nonce,
+            'target': int(target),
+            'hash': blockpack.to_hex(h)
+        } for timestamp, data, prev_hash, h, nonce, target in rows]
+
+    def view(self, user_id, block_cls=None):
+        return ChainView(self, user_id, block_cls)
+
+    def put_job(self, owner, user_id, info):
+        """Record or update a mining job (a MiningJob.to_dict()) run by owner"""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE"
+                         " SET owner = excluded.owner, updated = excluded.updated, info = excluded.info",
+                         (info['id'], user_id, owner, now, now, json.dumps(info)))
+
+    def touch_jobs(self, owner):
+        """Heartbeat for owner's jobs; also clears out jobs whose worker died"""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET updated = ? WHERE owner = ?", (now, owner))
+            conn.execute("DELETE FROM jobs WHERE updated < ?", (now - JOB_TIMEOUT,))
+
+    def drop_job(self, job_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def jobs(self, user_id):
+        """The user's live jobs across all workers, oldest first"""
+        with self._conn() as conn:
+            rows = conn.execute("SELECT info FROM jobs WHERE user_id = ? AND updated >= ? ORDER BY created",
+                                (user_id, time.time() - JOB_TIMEOUT)).fetchall()
+        return [json.loads(info) for info, in rows]
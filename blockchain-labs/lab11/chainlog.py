@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+class ChainLog:
+    """Append-only, per-user block log (one JSON record per line).
+
+    Records are {"op": "reset", ...chain settings}, {"op": "block", ...block}
+    and {"op": "target", "target": ...}. A reset starts a new chain, so it is
+    written by replacing the file with just the reset and genesis records;
+    that is also when the log gets compacted. Everything else is appended.
+
+    Each process keeps the byte offset of every block record per user and
+    only scans what was appended since it last looked, so reading block i
+    is a seek, not a parse of the whole file.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.cache = {}  # user_id -> scan state
+        self.lock = threading.Lock()  # request threads and mempool assemblers scan concurrently
+        self.job_info = {}  # job id -> (user_id, info); one process, so jobs can stay in memory
+
+    def path(self, user_id):
+        return os.path.join(self.directory, user_id + ".log")
+
+    def exists(self, user_id):
+        return os.path.exists(self.path(user_id))
+
+    def reset(self, user_id, genesis, target, retarget_interval, block_time):
+        """Start a new chain for the user; replaces (and so compacts) the old log"""
+        path = self.path(user_id)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._line({'op': 'reset', 'target': target,
+                                'retarget_interval': retarget_interval, 'block_time': block_time}))
+            f.write(self._line(dict(genesis, op='block')))
+        os.replace(tmp, path)
+
+    def append(self, user_id, block):
+        self._write(user_id, dict(block, op='block'))
+
+    def append_many(self, user_id, blocks):
+        with open(self.path(user_id), "ab") as f:
+            f.write(b"".join(self._line(dict(block, op='block')) for block in blocks))
+
+    def set_target(self, user_id, target):
+        self._write(user_id, {'op': 'target', 'target': target})
+
+    def state(self, user_id):
+        """Chain settings, current target and block count"""
+        s = self._scan(user_id)
+        return {
+            'target': s['target'],
+            'retarget_interval': s['retarget_interval'],
+            'block_time': s['block_time'],
+            'length': len(s['offsets'])
+        }
+
+    def blocks(self, user_id, start=0, stop=None):
+        """Block dicts for heights [start, stop), read straight from their offsets"""
+        offsets = self._scan(user_id)['offsets']
+        start, stop, _ = slice(start, stop).indices(len(offsets))
+        if start >= stop:
+            return []
+        out = []
+        with open(self.path(user_id), "rb") as f:
+            f.seek(offsets[start])
+            while len(out) < stop - start:
+                record = json.loads(f.readline())
+                if record.pop('op') == 'block':
+                    out.append(record)
+        return out
+
+    def view(self, user_id, block_cls=None):
+        return ChainView(self, user_id, block_cls)
+
+    def put_job(self, owner, user_id, info):
+        with self.lock:
+            self.job_info[info['id']] = (user_id, info)
+
+    def touch_jobs(self, owner):
+        pass
+
+    def drop_job(self, job_id):
+        with self.lock:
+            self.job_info.pop(job_id, None)
+
+    def jobs(self, user_id):
+        with self.lock:
+            return [info for uid, info in self.job_info.values() if uid == user_id]
+
+    @contextmanager
+    def batch(self):
+        # Appends are already single writes; nothing to group (see ChainDB.batch)
+        yield
+
+    def _line(self, record):
+        return (json.dumps(record) + "\n").encode()
+
+    def _write(self, user_id, record):
+        # One write() on an O_APPEND file, so concurrent workers don't interleave lines
+        with open(self.path(user_id), "ab") as f:
+            f.write(self._line(record))
+
+    def _scan(self, user_id):
+        with self.lock:
+            return self._scan_locked(user_id)
+
+    def _scan_locked(self, user_id):
+        path = self.path(user_id)
+        st = os.stat(path)
+        s = self.cache.get(user_id)
+        if s is None or s['inode'] != st.st_ino or s['end'] > st.st_size:
+            s = {'inode': st.st_ino, 'end': 0, 'offsets': [], 'target': None,
+                 'retarget_interval': 0, 'block_time': 10}
+            self.cache[user_id] = s
+        if s['end'] == st.st_size:
+            return s
+        with open(path, "rb") as f:
+            f.seek(s['end'])
+            pos = s['end']
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # half-written by another worker; pick it up next time
+                record = json.loads(line)
+                op = record['op']
+                if op == 'block':
+                    s['offsets'].append(pos)
+                elif op == 'target':
+                    s['target'] = record['target']
+                elif op == 'reset':
+                    s['offsets'] = []
+                    s['target'] = record['target']
+                    s['retarget_interval'] = record['retarget_interval']
+                    s['block_time'] = record['block_time']
+                pos += len(line)
+            s['end'] = pos
+        return s
+
+class ChainView:
+    """Read-only sequence over a user's logged blocks, loaded on access"""
+
+    def __init__(self, log, user_id, block_cls=None):
+        self.log = log
+        self.user_id = user_id
+        self.block_cls = block_cls  # wraps each dict, e.g. Block.from_dict
+
+    def _wrap(self, data):
+        return self.block_cls.from_dict(data) if self.block_cls else data
+
+    def __len__(self):
+        return self.log.state(self.user_id)['length']
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return [self._wrap(b) for b in self.log.blocks(self.user_id, start, stop)][::step]
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("block index out of range")
+        return self._wrap(self.log.blocks(self.user_id, index, index + 1)[0])
+
+    def __iter__(self):
+        # A chunk at a time, so walking a long chain doesn't load all of it
+        for start in range(0, len(self), 1000):
+            yield from self[start:start + 1000]
+
+    def append(self, block):
+        self.log.append(self.user_id, block.to_dict())
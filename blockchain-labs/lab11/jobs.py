@@ -0,0 +1,276 @@
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mining
+
+class MiningJob:
+    def __init__(self, user_id, kind, data, target, job_id=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.user_id = user_id
+        self.kind = kind  # "add" or "reset"
+        self.data = data
+        self.target = target
+        self.status = "queued"
+        self.tried = 0
+        self.started = None
+        self.finished = None
+        self.block = None
+        self.timestamp = None
+        self.prev_hash = None
+        self.submitted = False
+        self.cancelled = False
+        self.tries = 0  # times mined; more than one if another block took its parent first
+        self.claim = None  # lock on the job's checkpoint while this process owns it
+
+    def hash_rate(self):
+        if self.started is None:
+            return 0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.tried / elapsed if elapsed > 0 else 0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'data': self.data,
+            'difficulty': round(mining.target_bits(self.target), 2),
+            'status': self.status,
+            'tried': self.tried,
+            'hash_rate': round(self.hash_rate()),
+            'hash': self.block['hash'] if self.block else None
+        }
+
+    def header(self):
+        """Everything needed to restart this job's mine after a restart"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'kind': self.kind,
+            'data': self.data,
+            'target': self.target,
+            'timestamp': self.timestamp,
+            'prev_hash': self.prev_hash
+        }
+
+    @classmethod
+    def from_header(cls, header):
+        job = cls(header['user_id'], header['kind'], header['data'], header['target'], header.get('id'))
+        job.timestamp = header['timestamp']
+        job.prev_hash = header['prev_hash']
+        return job
+
+MAX_TRIES = 5  # blocks mined for one job before it's given up on
+
+class MiningQueue:
+    """Mines blocks on background threads so requests return immediately.
+
+    Jobs for one user run one after another. Each one builds on the tip
+    the user's chain has when it starts and is mined at the target the
+    chain's retarget rule gives next, both from tip(user_id). It's handed to
+    on_done(job) as soon as it's mined, in the thread (and so the worker
+    process) that mined it. on_done stores the block and returns True, or
+    returns False if the chain has moved on meanwhile (e.g. another worker
+    added a block), and the job is mined again on the new tip.
+
+    With store set (a ChainLog or ChainDB), every job's progress is kept
+    there too, so status() shows a user's jobs whichever worker is mining
+    them. With checkpoint_dir set, running jobs checkpoint their progress
+    there and are restarted from it when the queue is created again, e.g.
+    after a deploy; each checkpoint is claimed by one process only.
+    """
+
+    def __init__(self, max_jobs=2, workers=1, checkpoint_dir=None, on_done=None, store=None, tip=None):
+        self.workers = workers
+        self.checkpoint_dir = checkpoint_dir
+        self.on_done = on_done
+        self.tip = tip
+        self.store = store
+        self.owner = str(uuid.uuid4())  # this queue's name on its jobs in the store
+        self.executor = ThreadPoolExecutor(max_jobs)
+        self.lock = threading.Lock()
+        self.jobs = {}   # user_id -> deque of unfinished jobs
+        if checkpoint_dir is not None:
+            self.resume()
+
+    def resume(self):
+        """Requeue the jobs that were mid-mine when the last process stopped"""
+        for path, saved in mining.list_checkpoints(self.checkpoint_dir):
+            if saved.get('meta') is None:
+                os.remove(path)
+                continue
+            claim = mining.claim_checkpoint(path)
+            if claim is None:
+                continue  # another worker is mining it
+            if not os.path.exists(path):
+                mining.release_checkpoint(claim)  # finished while we were claiming it
+                continue
+            job = MiningJob.from_header(saved['meta'])
+            job.claim = claim
+            self._enqueue(job)
+
+    def add(self, user_id, data, target):
+        """Queue data for a block; target is a guess for display, the job's real one is set when it starts"""
+        return self._enqueue(MiningJob(user_id, "add", data, target))
+
+    def reset(self, user_id, difficulty):
+        """Cancel the user's outstanding jobs and queue a new genesis block at `difficulty` bits"""
+        target = mining.bits_target(difficulty)
+        cancelled = []
+        with self.lock:
+            for job in self.jobs.get(user_id, ()):
+                if job.status in ("queued", "running"):
+                    job.cancelled = True
+                    job.status = "cancelled"
+                    cancelled.append(job)
+        for job in cancelled:
+            self._publish(job)
+        return self._enqueue(MiningJob(user_id, "reset", "Genesis Block", target))
+
+    def _enqueue(self, job):
+        with self.lock:
+            queue = self.jobs.setdefault(job.user_id, deque())
+            queue.append(job)
+            # A done job is still being handed to on_done; the next one waits for that
+            if not any(j.status in ("running", "done") or (j.status == "queued" and j.submitted) for j in queue):
+                self._submit(job)
+        self._publish(job)
+        return job
+
+    def _submit(self, job):
+        # Called with self.lock held
+        job.submitted = True
+        self.executor.submit(self._run, job)
+
+    def _run(self, job):
+        with self.lock:
+            if job.cancelled:
+                self._finish(job)
+                return
+            job.status = "running"
+            job.started = time.time()
+        try:
+            result = self._mine(job)
+        except Exception:
+            # e.g. an unwritable checkpoint dir; don't leave the user's later jobs waiting on this one
+            logging.exception("Mining job %s for user %s failed", job.id, job.user_id)
+            with self.lock:
+                job.finished = time.time()
+                job.status = "failed"
+                self._finish(job)
+            return
+
+        with self.lock:
+            job.finished = time.time()
+            if result is not None and not job.cancelled:
+                nonce, h = result
+                job.block = {
+                    'timestamp': job.timestamp,
+                    'data': job.data,
+                    'prev_hash': job.prev_hash,
+                    'nonce': nonce,
+                    'target': job.target,
+                    'hash': h
+                }
+                job.status = "done"
+                job.tries += 1
+        if job.status == "done" and self.on_done is not None:
+            try:
+                stored = self.on_done(job)
+            except Exception:
+                logging.exception("Couldn't store the block of job %s", job.id)
+                stored = False
+            if not stored:
+                with self.lock:
+                    self._retry(job)
+                return
+        with self.lock:
+            self._finish(job)
+
+    def _mine(self, job):
+        """Set up the job's header and search for its nonce; None if it was cancelled"""
+        if job.prev_hash is None and job.kind == "reset":
+            job.prev_hash = "0"
+        elif job.prev_hash is None:
+            # The previous job's block is already stored, so the stored tip and target are current
+            job.prev_hash, job.target = self.tip(job.user_id)
+        if job.timestamp is None:
+            job.timestamp = time.time()
+        if self.checkpoint_dir is not None and job.claim is None:
+            job.claim = mining.claim_checkpoint(mining.header_checkpoint(
+                self.checkpoint_dir, job.timestamp, job.data, job.prev_hash, target=job.target))
+        self._publish(job)
+        last = time.monotonic()
+
+        def progress(tried):
+            nonlocal last
+            job.tried = tried
+            if self.store is not None and time.monotonic() - last >= 1:
+                # Also tells other workers this process's jobs are still alive
+                self._publish(job)
+                self.store.touch_jobs(self.owner)
+                last = time.monotonic()
+            return not job.cancelled
+
+        return mining.mine(job.timestamp, job.data, job.prev_hash, workers=self.workers,
+                           progress=progress, target=job.target,
+                           checkpoint_dir=self.checkpoint_dir, checkpoint_meta=job.header())
+
+    def _retry(self, job):
+        # Called with self.lock held: mine a block that couldn't be stored again, on the new tip
+        if job.claim is not None:
+            mining.release_checkpoint(job.claim)
+            job.claim = None
+        if job.tries >= MAX_TRIES:
+            logging.error("Gave up on job %s for user %s after %d blocks that couldn't be stored: %r",
+                          job.id, job.user_id, job.tries, job.data)
+            job.status = "failed"
+            self._finish(job)
+            return
+        job.prev_hash = job.timestamp = job.block = None
+        job.status = "queued"
+        job.tried = 0
+        # Still first in the user's queue, so nothing queued behind it starts meanwhile
+        self._submit(job)
+
+    def _finish(self, job):
+        # Called with self.lock held: forget the job and start the user's next one
+        if job.cancelled and self.checkpoint_dir is not None and job.prev_hash is not None:
+            mining.discard_checkpoint(self.checkpoint_dir, job.timestamp, job.data,
+                                      job.prev_hash, target=job.target)
+        if job.claim is not None:
+            mining.release_checkpoint(job.claim)
+            job.claim = None
+        queue = self.jobs.get(job.user_id)
+        if queue is not None:
+            queue.remove(job)
+            if not queue:
+                del self.jobs[job.user_id]
+        if self.store is not None:
+            self.store.drop_job(job.id)
+        self._start_next(job.user_id)
+
+    def _start_next(self, user_id):
+        # Called with self.lock held
+        for job in self.jobs.get(user_id, ()):
+            if job.status == "queued":
+                if not job.submitted:
+                    self._submit(job)
+                return
+
+    def _publish(self, job):
+        if self.store is not None:
+            self.store.put_job(self.owner, job.user_id, job.to_dict())
+
+    def status(self, user_id):
+        """The user's unfinished jobs, from every worker when there is a store"""
+        if self.store is not None:
+            return self.store.jobs(user_id)
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.get(user_id, ())]
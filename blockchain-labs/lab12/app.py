@@ -1,33 +1,103 @@
-from flask import Flask, render_template, request, redirect
-from blockchain import Blockchain
+from flask import Flask, stream_template, request, redirect, jsonify, abort
+from blockchain import Blockchain, Block
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import paging
+import network
+import mempool
 
 app = Flask(__name__)
 
-nodes = {
-    "A": Blockchain(difficulty=2),
-    "B": Blockchain(difficulty=2),
-    "C": Blockchain(difficulty=2)
-}
+# NETWORK_NODES=12 runs each node as its own process (node.py) gossiping
+# blocks to the others; the app is then just a dashboard over them
+NETWORK_NODES = int(os.environ.get('NETWORK_NODES', 0))
+
+if NETWORK_NODES:
+    nodes = network.start_network(os.path.join(app.root_path, 'node.py'), NETWORK_NODES, Block,
+                                  int(os.environ.get('NETWORK_PORT', 7100)))
+else:
+    nodes = {
+        "A": Blockchain(difficulty=8),
+        "B": Blockchain(difficulty=8),
+        "C": Blockchain(difficulty=8)
+    }
+
+# Blocks are added from requests and from the mempool assemblers' threads
+chain_lock = threading.Lock()
+
+def commit_block(node_id, data):
+    """Mine data (an entry or a list of them) on node_id and bring the others up to date"""
+    with chain_lock:
+        nodes[node_id].add_block(data)
+        # Networked nodes pass the block on by gossip themselves
+        for other_id, chain in nodes.items():
+            if other_id != node_id and not NETWORK_NODES:
+                nodes[other_id].sync_from(nodes[node_id])
+
+# Entries sent to /submit, batched per node (sizes from MEMPOOL_BLOCK/MEMPOOL_WAIT)
+pools = mempool.Pools(commit_block)
 
 @app.route('/')
 def index():
-    return render_template('index.html', nodes=nodes)
+    # One cursor for every node: newest page first, ?before=<height> pages back
+    page = paging.page(max(len(bc.chain) for bc in nodes.values()), request.args.get('before', type=int))
+    blocks = {nid: paging.newest_first(bc, page) for nid, bc in nodes.items()}
+    return stream_template('index.html', nodes=nodes, blocks=blocks, page=page, pending={nid: pools.pending(nid) for nid in nodes})
 
 @app.route('/add/<node_id>', methods=['POST'])
 def add(node_id):
     data = request.form.get('data')
     if data:
-        nodes[node_id].add_block(data)
-        for other_id, chain in nodes.items():
-            if other_id != node_id:
-                nodes[other_id].sync_from(nodes[node_id].chain)
+        commit_block(node_id, data)
     return redirect('/')
 
+@app.route('/submit/<node_id>', methods=['POST'])
+def submit(node_id):
+    """Queue entries for node_id's next batched block and return at once"""
+    if node_id not in nodes:
+        abort(404)
+    try:
+        entries, is_json = mempool.request_entries(request)
+    except ValueError as e:
+        abort(400, str(e))
+    accepted = pools.submit(node_id, entries)
+    if not is_json:
+        return redirect('/')
+    return jsonify(accepted=accepted, pending=pools.pending(node_id)), 202
+
 @app.route('/tamper/<node_id>/<int:block_index>', methods=['POST'])
 def tamper(node_id, block_index):
     new_data = request.form.get('new_data')
-    nodes[node_id].tamper_block(block_index, new_data)
+    with chain_lock:
+        nodes[node_id].tamper_block(block_index, new_data)
     return redirect('/')
 
+@app.route('/proof/<node_id>/<int:block_index>/<int:entry_index>')
+def proof(node_id, block_index, entry_index):
+    """Merkle inclusion proof for one entry of one block"""
+    node = nodes.get(node_id)
+    if node is None:
+        abort(404)
+    if not 0 <= block_index < len(node.chain) or not 0 <= entry_index < len(node.chain[block_index].entries):
+        abort(404)
+    block = node.chain[block_index]
+    entry = block.entries[entry_index]
+    path = node.inclusion_proof(block_index, entry_index)
+    return jsonify(entry=entry, proof=path, merkle_root=block.merkle_root, block_hash=block.hash,
+                   verified=node.verify_inclusion(block_index, entry, path))
+
+@app.route('/block/<node_id>/<block_hash>')
+def block_by_hash(node_id, block_hash):
+    """Look up one block of a node by its hash"""
+    node = nodes.get(node_id)
+    block = node.get_block(block_hash) if node else None
+    if block is None:
+        abort(404)
+    return jsonify(height=node.height_of(block_hash), block=block.to_dict())
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    # The reloader would start a second set of node processes
+    app.run(debug=True, use_reloader=not NETWORK_NODES)
@@ -1,50 +1,264 @@
 import hashlib
 import time
-import copy
+import os
+import sys
 
-class Block:
-    def __init__(self, data, prev_hash, difficulty=2):
-        self.timestamp = time.time()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mining
+import validation
+import merkle
+import blockpack
+import chainfile
+
+# Source of block timestamps; benchmarks swap in a fixed clock
+clock = time.time
+
+class Block(blockpack.SealedHeader):
+    # timestamp, prev_hash, hash and nonce are packed into self.header.
+    # Blocks are sealed once mined and shared between nodes; see replace()
+    __slots__ = ("entries", "root", "target")
+
+    def __init__(self, data, prev_hash, target, engine="hashlib"):
+        self.set_header(clock(), prev_hash, "0", 0)
         self.data = data
-        self.prev_hash = prev_hash
-        self.nonce = 0
-        self.difficulty = difficulty
-        self.hash = self.mine()
+        self.target = target
+        self.hash = self.mine(engine)
+        self.seal()
+
+    def replace(self, data):
+        """New block with this header but different data; rehashed, not re-mined"""
+        block = Block.__new__(Block)
+        block.header = self.header
+        block.data = data
+        block.target = self.target
+        block.hash = block.calculate_hash()
+        return block.seal()
+
+    @property
+    def difficulty(self):
+        return mining.target_bits(self.target)
+
+    @property
+    def data(self):
+        return " | ".join(self.entries)
+
+    @data.setter
+    def data(self, value):
+        # A block holds a list of entries; a plain string is a one-entry block
+        self.entries = (value,) if isinstance(value, str) else tuple(value)
+        self.root = bytes.fromhex(merkle.merkle_root(self.entries))
+
+    @property
+    def merkle_root(self):
+        return self.root.hex()
+
+    def to_dict(self):
+        return {
+            'timestamp': self.timestamp,
+            'entries': list(self.entries),
+            'merkle_root': self.merkle_root,
+            'prev_hash': self.prev_hash,
+            'nonce': self.nonce,
+            'target': self.target,
+            'hash': self.hash
+        }
+
+    def payload(self):
+        return {'data': list(self.entries), 'target': self.target}
+
+    @classmethod
+    def from_dict(cls, data):
+        block = cls.__new__(cls)
+        block.set_header(data['timestamp'], data['prev_hash'], data['hash'], data['nonce'])
+        block.data = data['entries']
+        block.target = data['target']
+        return block.seal()
 
     def calculate_hash(self):
-        text = f"{self.timestamp}{self.data}{self.prev_hash}{self.nonce}"
+        text = f"{self.timestamp}{merkle.merkle_root(self.entries)}{self.prev_hash}{self.nonce}"
         return hashlib.sha256(text.encode()).hexdigest()
 
-    def mine(self):
-        prefix = "0" * self.difficulty
-        while True:
-            h = self.calculate_hash()
-            if h.startswith(prefix):
-                return h
-            self.nonce += 1
+    def mine(self, engine="hashlib"):
+        self.nonce, h = mining.mine(self.timestamp, self.merkle_root, self.prev_hash,
+                                    start=self.nonce, engine=engine, target=self.target)
+        return h
 
 class Blockchain:
-    def __init__(self, difficulty=2):
-        self.difficulty = difficulty
-        self.chain = [Block("Genesis Block", "0", difficulty)]
+    def __init__(self, difficulty=8, engine="hashlib", retarget_interval=0, block_time=10):
+        # difficulty is in bits; retarget_interval=0 keeps the target fixed
+        self.target = mining.bits_target(difficulty)
+        self.engine = engine
+        self.retarget_interval = retarget_interval
+        self.block_time = block_time
+        self.chain = [Block("Genesis Block", "0", self.target, engine)]
+        # Every block up to this index is known to be valid
+        self.verified = 0
+        # digest -> height; the chain list itself maps height -> block
+        self.heights = {self.chain[0].digest: 0}
+
+    @classmethod
+    def open(cls, path, engine="hashlib", retarget_interval=0, block_time=10):
+        """Blockchain over a chain file; blocks are only read when they're used"""
+        blockchain = cls.__new__(cls)
+        blockchain.engine = engine
+        blockchain.retarget_interval = retarget_interval
+        blockchain.block_time = block_time
+        blockchain.chain = chainfile.ChainFile(path, Block)
+        blockchain.target = mining.next_target(blockchain.chain, blockchain.chain[-1].target,
+                                               retarget_interval, block_time)
+        blockchain.verified = 0
+        blockchain.heights = chainfile.HeightIndex(blockchain.chain)
+        return blockchain
+
+    def save(self, path):
+        chainfile.write_chain(path, self.chain)
+
+    @property
+    def difficulty(self):
+        return mining.target_bits(self.target)
 
     def add_block(self, data):
         prev_hash = self.chain[-1].hash
-        self.chain.append(Block(data, prev_hash, self.difficulty))
+        self._append(Block(data, prev_hash, self.target, self.engine))
+
+    def receive_block(self, block):
+        """Append a block mined elsewhere if it extends our tip and its hash checks out"""
+        # The target is ours to decide, not the sender's
+        if block.prev_digest != self.chain[-1].digest or block.hash != block.calculate_hash() \
+                or block.target != self.target or not mining.meets_target(block.hash, self.target):
+            return False
+        self._append(block)
+        return True
+
+    def _continues(self, same, blocks):
+        """Whether blocks validly follow chain[:same]: linked, hashed and mined at our targets"""
+        chain = self.chain[:same]
+        for block in blocks:
+            if chain:
+                prev, target = chain[-1].digest, mining.next_target(chain, chain[-1].target,
+                                                                    self.retarget_interval, self.block_time)
+            else:
+                prev, target = blockpack.NULL_DIGEST, self.chain[0].target
+            if block.prev_digest != prev or block.hash != block.calculate_hash() \
+                    or block.target != target or not mining.meets_target(block.hash, target):
+                return False
+            chain.append(block)
+        return True
+
+    def _append(self, block):
+        self.chain.append(block)
+        self.heights[block.digest] = len(self.chain) - 1
+        if self.verified == len(self.chain) - 2:
+            self.verified += 1
+        self.target = mining.next_target(self.chain, self.target, self.retarget_interval, self.block_time)
 
     def tamper_block(self, index, new_data):
         if 0 <= index < len(self.chain):
-            self.chain[index].data = new_data  # Tamper!
-            self.chain[index].hash = self.chain[index].calculate_hash()
+            old = self.chain[index]
+            # Tamper! Copy-on-write, since other nodes may hold the same block
+            self.chain[index] = old.replace(new_data)
+            if self.heights.get(old.digest) == index:
+                del self.heights[old.digest]
+            self.heights[self.chain[index].digest] = index
+            self.verified = max(0, min(self.verified, index - 1))
 
-    def is_valid(self):
-        for i in range(1, len(self.chain)):
-            if self.chain[i].prev_hash != self.chain[i-1].hash:
-                return False
-            if self.chain[i].hash != self.chain[i].calculate_hash():
+    def is_valid(self, full=False):
+        # Only blocks past the watermark are rehashed unless full=True
+        start = 1 if full else self.verified + 1
+        for i in range(start, len(self.chain)):
+            if self.chain[i].prev_digest != self.chain[i-1].digest or \
+                    self.chain[i].hash != self.chain[i].calculate_hash():
+                self.verified = i - 1
                 return False
+        self.verified = len(self.chain) - 1
         return True
 
-    def sync_from(self, other_chain):
-        # Deep copy so objects aren't shared
-        self.chain = copy.deepcopy(other_chain)
+    def height_of(self, block_hash):
+        try:
+            return self.heights.get(blockpack.to_digest(block_hash))
+        except ValueError:
+            return None
+
+    def knows(self, block_hash):
+        return self.height_of(block_hash) is not None
+
+    def get_block(self, block_hash):
+        height = self.height_of(block_hash)
+        return None if height is None else self.chain[height]
+
+    def block_at(self, height):
+        return self.chain[height] if 0 <= height < len(self.chain) else None
+
+    def block_range(self, start, stop):
+        """Blocks at heights [start, stop), clamped to the chain"""
+        return self.chain[max(0, start):max(0, stop)]
+
+    def inclusion_proof(self, block_index, entry_index):
+        """Merkle path showing chain[block_index] holds that entry"""
+        return merkle.merkle_proof(self.chain[block_index].entries, entry_index)
+
+    def verify_inclusion(self, block_index, entry, proof):
+        block = self.chain[block_index]
+        return block.hash == block.calculate_hash() and merkle.verify_proof(entry, proof, block.merkle_root)
+
+    def first_invalid(self, workers=None):
+        """Check the whole chain on a process pool; index of the first bad block, or None"""
+        bad = validation.first_invalid(self.chain, workers)
+        self.verified = len(self.chain) - 1 if bad is None else bad - 1
+        return bad
+
+    def common_prefix(self, peer):
+        """Number of leading blocks this chain shares with peer's chain"""
+        n = min(len(self.chain), len(peer.chain))
+        # Up to both watermarks every block links to the one before it, so one
+        # matching hash there means the whole prefix below it matches too
+        safe = min(self.verified, peer.verified, n - 1)
+        if self.chain[safe].digest == peer.chain[safe].digest:
+            same = safe + 1
+        else:
+            lo, hi = 0, safe  # first differing height is in [lo, hi]
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.chain[mid].digest == peer.chain[mid].digest:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+        # Past the watermarks links aren't trusted, so compare block by block
+        while same < n and self.chain[same].digest == peer.chain[same].digest:
+            same += 1
+        return same
+
+    def sync_from(self, peer, verify=False):
+        """Become a copy of peer's chain, moving only the blocks after the common prefix.
+
+        With verify=True (a peer we don't trust, e.g. over the network) the
+        new blocks are checked first and nothing changes if any fails;
+        returns whether the peer's chain was taken.
+        """
+        same = self.common_prefix(peer)
+        suffix = peer.chain[same:]
+        if verify and not self._continues(same, suffix):
+            return False
+        for height in range(same, len(self.chain)):
+            digest = self.chain[height].digest
+            if self.heights.get(digest) == height:
+                del self.heights[digest]
+        # Blocks are immutable, so the suffix is shared with peer, not copied
+        if same == len(self.chain):
+            for block in suffix:
+                self.chain.append(block)  # a chain file just grows on disk
+        else:
+            if not isinstance(self.chain, list):
+                self.chain = list(self.chain)  # a chain file can't shrink; load it the first time
+            self.chain[same:] = suffix
+        for height in range(same, len(self.chain)):
+            self.heights[self.chain[height].digest] = height
+        if verify:
+            # A remote peer's watermark is only its claim
+            self.verified = max(0, min(self.verified, same - 1))
+        else:
+            # Block for block the same chain as peer now, so its watermark holds here too
+            self.verified = peer.verified
+        self.target = mining.next_target(self.chain, self.chain[-1].target, self.retarget_interval, self.block_time)
+        return True
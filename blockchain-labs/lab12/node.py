@@ -0,0 +1,21 @@
+import os
+import sys
+from blockchain import Blockchain, Block
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import network
+
+# One lab12 node as its own process; app.py starts these when NETWORK_NODES is set.
+#   python node.py --id A --port 7100 --peers http://127.0.0.1:7101,...
+
+def main():
+    args = network.node_args()
+    chain = Blockchain(difficulty=args.difficulty or 8)
+    # sync_from works out the common prefix with the peer, pulls only what's
+    # after it and checks those blocks before taking them
+    network.NodeServer(args.id, chain, Block, args.port, args.peers,
+                       catch_up=lambda chain, peer: chain.sync_from(peer, verify=True),
+                       fanout=args.fanout, interval=args.interval).serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,175 @@
-from flask import Flask, render_template, request, redirect
-from blockchain import Blockchain
+from flask import Flask, stream_template, request, redirect, jsonify, abort, Response, stream_with_context
+from blockchain import Blockchain, Block
+from remine import EventBus, Remine
 from collections import Counter
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import paging
+import network
+import mempool
 
 app = Flask(__name__)
 
-nodes = {
-    "A": Blockchain(difficulty=2),
-    "B": Blockchain(difficulty=2),
-    "C": Blockchain(difficulty=2)
-}
+# NETWORK_NODES=12 runs each node as its own process (node.py) gossiping
+# blocks to the others; the app is then just a dashboard over them
+NETWORK_NODES = int(os.environ.get('NETWORK_NODES', 0))
+
+if NETWORK_NODES:
+    nodes = network.start_network(os.path.join(app.root_path, 'node.py'), NETWORK_NODES, Block,
+                                  int(os.environ.get('NETWORK_PORT', 7200)))
+else:
+    nodes = {
+        "A": Blockchain(difficulty=2),
+        "B": Blockchain(difficulty=2),
+        "C": Blockchain(difficulty=2)
+    }
+
+# Tamper re-mines run in the background and report each block over /events
+bus = EventBus()
+remines = {}
+
+def remining(node_id):
+    task = remines.get(node_id)
+    return task is not None and task.running()
+
+# Guards the nodes: blocks are added from requests and from the mempool
+# assemblers' threads, and re-mines write each block while holding it
+chain_lock = threading.Lock()
+
+def stop_remine(node_id):
+    # Call with chain_lock held
+    if remining(node_id):
+        remines[node_id].cancel()
+
+def commit_block(node_id, data):
+    """Mine data (an entry or a list of them) on node_id and sync the others from it"""
+    with chain_lock:
+        # A tamper re-mine on this node finishes first
+        if remining(node_id):
+            remines[node_id].finish()
+        nodes[node_id].add_block(data)
+        # Automatically sync all others; networked nodes gossip the block instead
+        for k in nodes:
+            if k != node_id and not NETWORK_NODES:
+                stop_remine(k)
+                nodes[k].sync_from(nodes[node_id].chain)
+
+# Entries sent to /submit, batched per node (sizes from MEMPOOL_BLOCK/MEMPOOL_WAIT)
+pools = mempool.Pools(commit_block)
 
 @app.route('/')
 def index():
-    return render_template('index.html', nodes=nodes)
+    busy = [nid for nid in nodes if remining(nid)]
+    # One cursor for every node: newest page first, ?before=<height> pages back
+    page = paging.page(max(len(bc.chain) for bc in nodes.values()), request.args.get('before', type=int))
+    blocks = {nid: paging.newest_first(bc, page) for nid, bc in nodes.items()}
+    return stream_template('index.html', nodes=nodes, busy=busy, blocks=blocks, page=page, pending={nid: pools.pending(nid) for nid in nodes})
 
 @app.route('/add/<node_id>', methods=['POST'])
 def add(node_id):
     data = request.form.get('data')
-    if data:
-        nodes[node_id].add_block(data)
-        # Automatically sync all others
-        for k in nodes:
-            if k != node_id:
-                nodes[k].sync_from(nodes[node_id].chain)
+    if data and not remining(node_id):
+        commit_block(node_id, data)
     return redirect('/')
 
+@app.route('/submit/<node_id>', methods=['POST'])
+def submit(node_id):
+    """Queue entries for node_id's next batched block and return at once"""
+    if node_id not in nodes:
+        abort(404)
+    try:
+        entries, is_json = mempool.request_entries(request)
+    except ValueError as e:
+        abort(400, str(e))
+    accepted = pools.submit(node_id, entries)
+    if not is_json:
+        return redirect('/')
+    return jsonify(accepted=accepted, pending=pools.pending(node_id)), 202
+
 @app.route('/tamper/<node_id>/<int:block_index>', methods=['POST'])
 def tamper(node_id, block_index):
     new_data = request.form.get('new_data')
-    nodes[node_id].tamper_block(block_index, new_data)
+    node = nodes[node_id]
+    if not 0 <= block_index < len(node.chain):
+        return redirect('/')
+    if NETWORK_NODES:
+        # The node process re-mines on its own side
+        node.tamper_block(block_index, new_data)
+        return redirect('/')
+    with chain_lock:
+        task = remines.get(node_id)
+        if remining(node_id):
+            # Restart the running re-mine from whichever block is now the earliest stale one
+            task.cancel()
+            start = min(block_index, task.position)
+            node.edit_block(block_index, new_data)
+            blocks = node.remine_from(start)
+        else:
+            start = block_index
+            blocks = node.tamper_block_iter(block_index, new_data)
+        remines[node_id] = Remine(node_id, blocks, start, len(node.chain), bus, chain_lock)
     return redirect('/')
 
+@app.route('/events')
+def events():
+    """Server-sent events for background re-mines"""
+    after = request.headers.get('Last-Event-ID', type=int)
+    return Response(stream_with_context(bus.stream(after)), mimetype='text/event-stream')
+
 @app.route('/consensus')
 def consensus():
-    chain_map = {}
-    for nid, node in nodes.items():
-        hlist = tuple(node.to_hash_list())
-        if hlist not in chain_map:
-            chain_map[hlist] = []
-        chain_map[hlist].append(node.chain)
-
-    most_common_chain = max(chain_map.items(), key=lambda x: len(x[1]))[1][0]
+    with chain_lock:
+        for nid in nodes:
+            stop_remine(nid)
+        # The most cumulative work wins; equally heavy chains go to a vote on
+        # their fingerprints, O(1) per node, which stops once one has a majority
+        work = {nid: node.chain_work() for nid, node in nodes.items()}
+        top = max(work.values())
+        votes = Counter()
+        holders = {}
+        for nid, node in nodes.items():
+            if work[nid] != top:
+                continue
+            fp = node.fingerprint()
+            holders.setdefault(fp, node)
+            votes[fp] += 1
+            if votes[fp] > len(nodes) // 2:
+                break
+        winner = votes.most_common(1)[0][0]
 
-    for node in nodes.values():
-        node.sync_from(most_common_chain)
+        best_chain = holders[winner].chain
+        for node in nodes.values():
+            if node.fingerprint() != winner:
+                node.sync_from(best_chain)
 
     return redirect('/')
 
+@app.route('/proof/<node_id>/<int:block_index>/<int:entry_index>')
+def proof(node_id, block_index, entry_index):
+    """Merkle inclusion proof for one entry of one block"""
+    node = nodes.get(node_id)
+    if node is None:
+        abort(404)
+    if not 0 <= block_index < len(node.chain) or not 0 <= entry_index < len(node.chain[block_index].entries):
+        abort(404)
+    block = node.chain[block_index]
+    entry = block.entries[entry_index]
+    path = node.inclusion_proof(block_index, entry_index)
+    return jsonify(entry=entry, proof=path, merkle_root=block.merkle_root, block_hash=block.hash,
+                   verified=node.verify_inclusion(block_index, entry, path))
+
+@app.route('/block/<node_id>/<block_hash>')
+def block_by_hash(node_id, block_hash):
+    """Look up one block of a node by its hash"""
+    node = nodes.get(node_id)
+    block = node.get_block(block_hash) if node else None
+    if block is None:
+        abort(404)
+    return jsonify(height=node.height_of(block_hash), block=block.to_dict())
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    # The reloader would start a second set of node processes
+    app.run(debug=True, port=5001, use_reloader=not NETWORK_NODES)
\ No newline at end of file
@@ -1,32 +1,89 @@
-import hashlib, time, copy
+import hashlib, time, os, sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mining
+import validation
+import merkle
+import blockpack
+import chainfile
+
+# Source of block timestamps; benchmarks swap in a fixed clock
+clock = time.time
+
+# Side-branch blocks this far below the tip are forgotten
+SIDE_DEPTH = 100
+
+class Block(blockpack.SealedHeader):
+    # timestamp, prev_hash, hash and nonce are packed into self.header.
+    # Blocks are immutable and shared between nodes; replace() and mined()
+    # return new ones
+    __slots__ = ("entries", "root")
 
-class Block:
     def __init__(self, data, prev_hash):
-        self.timestamp = time.time()
+        self.set_header(clock(), prev_hash, "0", 0)
         self.data = data
-        self.prev_hash = prev_hash
-        self.nonce = 0
         self.hash = self.hash_self()
+        self.seal()
+
+    def replace(self, data=None, prev_hash=None, nonce=None, hash=None):
+        """New block like this one with some fields changed; rehashed unless hash is given"""
+        block = Block.__new__(Block)
+        block.header = self.header
+        if data is None:
+            block.entries, block.root = self.entries, self.root
+        else:
+            block.data = data
+        if prev_hash is not None:
+            block.prev_hash = prev_hash
+        if nonce is not None:
+            block.nonce = nonce
+        block.hash = block.hash_self() if hash is None else hash
+        return block.seal()
+
+    @property
+    def data(self):
+        return " | ".join(self.entries)
+
+    @data.setter
+    def data(self, value):
+        # A block holds a list of entries; a plain string is a one-entry block
+        self.entries = (value,) if isinstance(value, str) else tuple(value)
+        self.root = bytes.fromhex(merkle.merkle_root(self.entries))
+
+    @property
+    def merkle_root(self):
+        return self.root.hex()
 
     def hash_self(self):
         sha = hashlib.sha256()
-        sha.update(f"{self.timestamp}{self.data}{self.prev_hash}{self.nonce}".encode())
+        sha.update(f"{self.timestamp}{merkle.merkle_root(self.entries)}{self.prev_hash}{self.nonce}".encode())
         return sha.hexdigest()
 
-    def mine(self, difficulty):
-        while not self.hash.startswith("0" * difficulty):
-            self.nonce += 1
-            self.hash = self.hash_self()
+    def mined(self, difficulty):
+        """This block with a nonce that meets difficulty"""
+        nonce, h = mining.mine(self.timestamp, self.merkle_root, self.prev_hash, difficulty, self.nonce)
+        return self.replace(nonce=nonce, hash=h)
 
     def to_dict(self):
         return {
             "timestamp": self.timestamp,
-            "data": self.data,
+            "entries": list(self.entries),
+            "merkle_root": self.merkle_root,
             "prev_hash": self.prev_hash,
             "nonce": self.nonce,
             "hash": self.hash
         }
 
+    def payload(self):
+        return {"data": list(self.entries)}
+
+    @classmethod
+    def from_dict(cls, data):
+        block = cls.__new__(cls)
+        block.set_header(data["timestamp"], data["prev_hash"], data["hash"], data["nonce"])
+        block.data = data["entries"]
+        return block.seal()
+
     def __eq__(self, other):
         return self.to_dict() == other.to_dict()
 
@@ -34,31 +91,260 @@ class Blockchain:
     def __init__(self, difficulty=2):
         self.difficulty = difficulty
         self.chain = [self.create_genesis()]
+        # digest -> height; the chain list itself maps height -> block
+        self.heights = {self.chain[0].digest: 0}
+        # rolls[i] is a digest of every block hash up to height i; filled in by fingerprint()
+        self.rolls = []
+        # works[i] is the proof of work in chain[:i + 1]; filled in by chain_work()
+        self.works = []
+        # digest -> (block, height, cumulative work) for blocks on competing branches
+        self.side = {}
+        # chain[:verified + 1] is known to hash and link correctly
+        self.verified = 0
+
+    @classmethod
+    def open(cls, path, difficulty=2):
+        """Blockchain over a chain file; blocks are only read when they're used"""
+        blockchain = cls.__new__(cls)
+        blockchain.difficulty = difficulty
+        blockchain.chain = chainfile.ChainFile(path, Block)
+        blockchain.heights = chainfile.HeightIndex(blockchain.chain)
+        blockchain.rolls = []
+        blockchain.works = []
+        blockchain.side = {}
+        blockchain.verified = 0
+        return blockchain
+
+    def save(self, path):
+        chainfile.write_chain(path, self.chain)
 
     def create_genesis(self):
-        b = Block("Genesis", "0")
-        b.mine(self.difficulty)
-        return b
+        return Block("Genesis", "0").mined(self.difficulty)
 
     def add_block(self, data):
         last_hash = self.chain[-1].hash
-        new_block = Block(data, last_hash)
-        new_block.mine(self.difficulty)
-        self.chain.append(new_block)
+        self._extend(Block(data, last_hash).mined(self.difficulty), checked=True)
+
+    def _extend(self, block, checked=False):
+        # checked: block is known to hash right and link to the old tip
+        self.chain.append(block)
+        self.heights[block.digest] = len(self.chain) - 1
+        if checked and self.verified == len(self.chain) - 2:
+            self.verified += 1
+        if len(self.chain) % SIDE_DEPTH == 0:
+            floor = len(self.chain) - SIDE_DEPTH
+            self.side = {d: entry for d, entry in self.side.items() if entry[1] >= floor}
+
+    def receive_block(self, block):
+        """Take a block mined elsewhere; False if it doesn't check out or its parent is unknown.
+
+        Blocks on competing branches are kept in self.side. The chain follows
+        the branch with the most cumulative work, ties going to the lower tip
+        hash, and switching only touches the blocks past the fork.
+        """
+        if block.digest in self.heights or block.digest in self.side:
+            return True
+        if block.hash != block.hash_self() or not block.hash.startswith("0" * self.difficulty):
+            return False
+        if block.prev_digest == self.chain[-1].digest:
+            self._extend(block, checked=True)
+            return True
+        parent = self.heights.get(block.prev_digest)
+        if parent is not None:
+            height, work = parent + 1, self.chain_work(parent)
+        elif block.prev_digest in self.side:
+            _, height, work = self.side[block.prev_digest]
+            height += 1
+        else:
+            return False
+        work += self._work(block.digest)
+        self.side[block.digest] = (block, height, work)
+        if (work, self.chain[-1].hash) > (self.chain_work(), block.hash):
+            self.reorg(block.digest)
+        return True
+
+    def reorg(self, digest):
+        """Switch onto the side branch ending at digest; False if its ancestry was pruned"""
+        branch = []
+        while digest not in self.heights:
+            entry = self.side.get(digest)
+            if entry is None:
+                return False
+            branch.append(entry[0])
+            digest = entry[0].prev_digest
+        self._unwind(self.heights[digest] + 1)
+        for block in reversed(branch):
+            del self.side[block.digest]
+            self._extend(block)
+        return True
+
+    def _unwind(self, keep):
+        """Cut the chain back to its first `keep` blocks, moving the rest to self.side"""
+        if not isinstance(self.chain, list):
+            self.chain = list(self.chain)  # a chain file can't shrink; load it the first time
+        for h in range(keep, len(self.chain)):
+            block = self.chain[h]
+            self.side[block.digest] = (block, h, self.chain_work(h))
+            if self.heights.get(block.digest) == h:
+                del self.heights[block.digest]
+        del self.chain[keep:]
+        del self.works[keep:]
+        del self.rolls[keep:]
+        self.verified = min(self.verified, max(0, keep - 1))
+
+    def _work(self, digest):
+        # Expected hashes to find a block at our difficulty; none for one that doesn't meet it
+        return 16 ** self.difficulty if digest.hex().startswith("0" * self.difficulty) else 0
+
+    def chain_work(self, height=None):
+        """Cumulative proof of work in chain[:height + 1], the whole chain by default"""
+        if height is None:
+            height = len(self.chain) - 1
+        works = self.works
+        if height >= len(works):
+            for digest in self._digests(len(works)):
+                works.append((works[-1] if works else 0) + self._work(digest))
+        return works[height]
+
+    def _digests(self, start):
+        if isinstance(self.chain, chainfile.ChainFile):
+            return self.chain.digests(start)
+        return (self.chain[i].digest for i in range(start, len(self.chain)))
+
+    def knows(self, block_hash):
+        """Whether block_hash is on the chain or one of the side branches"""
+        try:
+            digest = blockpack.to_digest(block_hash)
+        except ValueError:
+            return False
+        return digest in self.heights or digest in self.side
 
     def tamper_block(self, index, new_data):
+        for _ in self.tamper_block_iter(index, new_data):
+            pass
+
+    def tamper_block_iter(self, index, new_data):
+        """Tamper with one block, then yield (i, block) as each later block is re-mined"""
         if 0 <= index < len(self.chain):
-            self.chain[index].data = new_data
-            for i in range(index, len(self.chain)):
-                if i == 0:
-                    self.chain[i].prev_hash = "0"
-                else:
-                    self.chain[i].prev_hash = self.chain[i - 1].hash
-                self.chain[i].hash = self.chain[i].hash_self()
-                self.chain[i].mine(self.difficulty)
-
-    def sync_from(self, chain):
-        self.chain = copy.deepcopy(chain)
+            self.edit_block(index, new_data)
+            yield from self.remine_from(index)
+
+    def edit_block(self, index, new_data):
+        """Swap in a copy of chain[index] holding new_data; other nodes keep the original"""
+        self._put(self.chain, index, self.chain[index].replace(data=new_data))
+
+    def _put(self, chain, i, block):
+        old = chain[i]
+        chain[i] = block
+        if chain is self.chain:
+            if self.heights.get(old.digest) == i:
+                del self.heights[old.digest]
+            self.heights[block.digest] = i
+            del self.rolls[i:]
+            del self.works[i:]
+            self.verified = min(self.verified, max(0, i - 1))
+
+    def remine_from(self, index):
+        """Re-link and re-mine chain[index:], one block per step.
+
+        The generator holds on to the list it started with, so it can be
+        paused and resumed freely, but stop it before a sync or reorg:
+        those change the list in place.
+        """
+        chain = self.chain
+        for i in range(index, len(chain)):
+            prev_hash = "0" if i == 0 else chain[i - 1].hash
+            # New blocks rather than edits: other nodes may share the old ones
+            self._put(chain, i, chain[i].replace(prev_hash=prev_hash).mined(self.difficulty))
+            yield i, chain[i]
+
+    def height_of(self, block_hash):
+        try:
+            return self.heights.get(blockpack.to_digest(block_hash))
+        except ValueError:
+            return None
+
+    def get_block(self, block_hash):
+        height = self.height_of(block_hash)
+        return None if height is None else self.chain[height]
+
+    def block_at(self, height):
+        return self.chain[height] if 0 <= height < len(self.chain) else None
+
+    def block_range(self, start, stop):
+        """Blocks at heights [start, stop), clamped to the chain"""
+        return self.chain[max(0, start):max(0, stop)]
+
+    def inclusion_proof(self, block_index, entry_index):
+        """Merkle path showing chain[block_index] holds that entry"""
+        return merkle.merkle_proof(self.chain[block_index].entries, entry_index)
+
+    def verify_inclusion(self, block_index, entry, proof):
+        block = self.chain[block_index]
+        return block.hash == block.hash_self() and merkle.verify_proof(entry, proof, block.merkle_root)
+
+    def first_invalid(self, workers=None, full=False):
+        """Index of the first bad block, or None.
+
+        Only blocks past the verified watermark are rehashed unless
+        full=True; a long run of them is checked on a process pool.
+        """
+        start = 1 if full else self.verified + 1
+        bad = validation.first_invalid(self.chain, workers, start=start)
+        self.verified = len(self.chain) - 1 if bad is None else bad - 1
+        return bad
+
+    def is_valid(self, full=False):
+        return self.first_invalid(full=full) is None
+
+    def fork_point(self, chain):
+        """How many leading blocks chain shares with ours, walking back from the shorter tip.
+
+        Blocks name their parent's hash, so a block we hold at the same
+        height vouches for everything below it.
+        """
+        h = min(len(chain), len(self.chain)) - 1
+        while h >= 0 and self.heights.get(chain[h].digest) != h:
+            h -= 1
+        return h + 1
+
+    def sync_from(self, chain, verify=False):
+        """Become a copy of chain, touching only the blocks past the fork point.
+
+        With verify=True (a chain from a peer we don't trust) the new blocks
+        are checked first and nothing changes if any fails; returns whether
+        the chain was taken.
+        """
+        same = self.fork_point(chain)
+        blocks = chain[same:]
+        if verify and not self._continues(same, blocks):
+            return False
+        # The blocks we drop stay in self.side, so we can switch back to them
+        self._unwind(same)
+        for block in blocks:
+            self._extend(block)
+        return True
+
+    def _continues(self, same, blocks):
+        """Whether blocks validly follow chain[:same]: linked, hashed and mined at our difficulty"""
+        prev = self.chain[same - 1].digest if same else blockpack.NULL_DIGEST
+        for block in blocks:
+            if block.prev_digest != prev or block.hash != block.hash_self() \
+                    or not block.hash.startswith("0" * self.difficulty):
+                return False
+            prev = block.digest
+        return True
+
+    def fingerprint(self):
+        """(height, tip hash, rolling digest of every block hash); equal only for equal chains.
+
+        Appends cost one hash each, paid here; edits drop the digests from
+        the changed height on, so this is O(1) for a chain that only grew.
+        """
+        rolls, chain = self.rolls, self.chain
+        for digest in self._digests(len(rolls)):
+            rolls.append(hashlib.sha256((rolls[-1] if rolls else b"") + digest).digest())
+        return len(chain) - 1, chain[-1].hash, rolls[-1].hex()
 
     def to_hash_list(self):
         return [block.hash for block in self.chain]
@@ -0,0 +1,22 @@
+import os
+import sys
+from blockchain import Blockchain, Block
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import network
+
+# One lab13 node as its own process; app.py starts these when NETWORK_NODES is set.
+#   python node.py --id A --port 7200 --peers http://127.0.0.1:7201,...
+
+def catch_up(chain, peer):
+    same = network.shared_prefix(chain.chain, peer.chain)
+    chain.sync_from(chain.chain[:same] + peer.chain[same:], verify=True)
+
+def main():
+    args = network.node_args()
+    chain = Blockchain(difficulty=args.difficulty or 2)
+    network.NodeServer(args.id, chain, Block, args.port, args.peers, catch_up,
+                       fanout=args.fanout, interval=args.interval).serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import json
+import threading
+from collections import deque
+
+class EventBus:
+    """Numbered events fanned out to any number of server-sent-event streams"""
+
+    def __init__(self, maxlen=1000):
+        self.events = deque(maxlen=maxlen)
+        self.seq = 0
+        self.cond = threading.Condition()
+
+    def publish(self, event):
+        with self.cond:
+            self.seq += 1
+            self.events.append((self.seq, event))
+            self.cond.notify_all()
+
+    def stream(self, after=None, keepalive=15):
+        """Yield SSE-formatted text for every event after sequence number `after`"""
+        if after is None:
+            after = self.seq
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.seq > after, timeout=keepalive)
+                new = [(seq, event) for seq, event in self.events if seq > after]
+            if not new:
+                yield ": keepalive\n\n"
+                continue
+            for seq, event in new:
+                after = seq
+                yield f"id: {seq}\ndata: {json.dumps(event)}\n\n"
+
+class Remine:
+    """Drives a re-mine generator on a background thread, publishing each block.
+
+    Every block is re-mined and written with lock held, the lock that
+    guards the chain, so callers holding it can cancel or finish the
+    re-mine without waiting for the thread.
+    """
+
+    def __init__(self, node_id, blocks, start, total, bus, lock):
+        self.node_id = node_id
+        self.blocks = blocks
+        self.position = start  # next index to be re-mined
+        self.total = total
+        self.bus = bus
+        self.lock = lock
+        self.cancelled = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def running(self):
+        return self.thread.is_alive() and not self.cancelled
+
+    def cancel(self):
+        """Stop before the next block; the generator is left as is. Call with the lock held"""
+        self.cancelled = True
+
+    def finish(self):
+        """Re-mine the rest of the blocks on this thread instead. Call with the lock held"""
+        self.cancelled = True
+        for i, block in self.blocks:
+            self._publish(i, block)
+        self._done()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if self.cancelled:
+                    return
+                step = next(self.blocks, None)
+                if step is None:
+                    self._done()
+                    return
+                self._publish(*step)
+
+    def _publish(self, i, block):
+        self.position = i + 1
+        self.bus.publish({
+            'type': 'block',
+            'node': self.node_id,
+            'index': i,
+            'total': self.total,
+            'hash': block.hash,
+            'prev_hash': block.prev_hash,
+            'nonce': block.nonce
+        })
+
+    def _done(self):
+        self.cancelled = True  # nothing left for the thread or finish() to do
+        self.bus.publish({'type': 'done', 'node': self.node_id})
@@ -0,0 +1,52 @@
+import hashlib
+
+# Merkle trees over a block's entries (8.py, lab12, lab13).
+#
+# Leaves and inner nodes are hashed with different one-byte prefixes so an
+# inner node can never be passed off as an entry. An odd node at the end of
+# a level is carried up unchanged rather than paired with itself.
+#
+# A proof is a list of [sibling_hash, side] pairs from the leaf up, where side
+# is "L" or "R" depending on which side the sibling sits.
+
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()
+
+def leaf_hash(entry):
+    return hashlib.sha256(b"\x00" + entry.encode()).hexdigest()
+
+def node_hash(left, right):
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+def _next_level(level):
+    up = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        up.append(level[-1])
+    return up
+
+def merkle_root(entries):
+    if not entries:
+        return EMPTY_ROOT
+    level = [leaf_hash(e) for e in entries]
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+def merkle_proof(entries, index):
+    """Sibling path proving entries[index] is under merkle_root(entries)"""
+    if not 0 <= index < len(entries):
+        raise IndexError("entry index out of range")
+    level = [leaf_hash(e) for e in entries]
+    proof = []
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append([level[sibling], "L" if sibling < index else "R"])
+        level = _next_level(level)
+        index //= 2
+    return proof
+
+def verify_proof(entry, proof, root):
+    h = leaf_hash(entry)
+    for sibling, side in proof:
+        h = node_hash(sibling, h) if side == "L" else node_hash(h, sibling)
+    return h == root
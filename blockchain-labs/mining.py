@@ -0,0 +1,299 @@
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from itertools import count
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # no flock (Windows): claims always succeed, so use one process per checkpoint dir
+
+# Shared proof-of-work kernel used by 9.py, 10.py and the lab11/12/13 blocks.
+#
+# All of them hash str(timestamp) + data + prev_hash + str(nonce). Only the
+# nonce changes between attempts, so the header prefix is fed into sha256 once
+# and the resulting state is copied for every nonce. The difficulty check is a
+# byte comparison on the raw digest instead of formatting a hex string.
+#
+# A target is the largest acceptable digest read as a 256-bit integer. Old
+# style difficulty (leading hex zeros) is just the target for 4 * d bits.
+
+CHUNK_SIZE = 20000
+CHECK_EVERY = 1000
+MAX_TARGET = 2 ** 256 - 1
+CHECKPOINT_INTERVAL = 2.0  # seconds between checkpoint writes
+
+def header_prefix(timestamp, data, prev_hash):
+    """Bytes of the part of the header that stays fixed while mining"""
+    return (str(timestamp) + data + prev_hash).encode()
+
+def bits_target(bits):
+    """Integer target whose valid digests have at least `bits` leading zero bits"""
+    return (1 << (256 - bits)) - 1
+
+def target_bits(target):
+    """Difficulty of a target in bits; fractional once the target has been retargeted"""
+    return 256 - math.log2(target + 1)
+
+def difficulty_target(difficulty):
+    """Largest 32-byte digest with at least `difficulty` leading hex zeros"""
+    return bits_target(4 * difficulty).to_bytes(32, "big")
+
+def meets_target(hash_hex, target):
+    return int(hash_hex, 16) <= target
+
+def retarget(target, actual, expected, max_step=4):
+    """Scale target by actual/expected time, moving at most max_step either way"""
+    ratio = min(max(actual / expected, 1 / max_step), max_step)
+    return max(1, min(target * int(ratio * 2 ** 32) >> 32, MAX_TARGET))
+
+def next_target(chain, target, interval, block_time):
+    """Target for the block after chain[-1].
+
+    Every `interval` blocks the target is adjusted so those blocks would have
+    taken interval * block_time seconds. interval=0 turns retargeting off.
+    """
+    if not interval or len(chain) <= interval or (len(chain) - 1) % interval:
+        return target
+    actual = chain[-1].timestamp - chain[-1 - interval].timestamp
+    return retarget(target, actual, interval * block_time)
+
+def search(prefix, target, start=0, stop=None):
+    """Return (nonce, hex hash) for the first nonce in [start, stop) whose
+    digest is <= target, or None if the range is exhausted"""
+    copy = hashlib.sha256(prefix).copy
+    nonces = count(start) if stop is None else range(start, stop)
+    for nonce in nonces:
+        h = copy()
+        h.update(b"%d" % nonce)
+        if h.digest() <= target:
+            return nonce, h.hexdigest()
+    return None
+
+def mine(timestamp, data, prev_hash, difficulty=None, start=0, workers=1, engine="hashlib",
+         progress=None, target=None, checkpoint_dir=None, checkpoint_meta=None):
+    """Find the lowest nonce >= start meeting the difficulty.
+
+    target, an integer from bits_target/retarget, takes the place of the
+    hex-zero difficulty when given. engine="numpy" uses the batch search in
+    mining_numpy (needs numpy; no faster than the default, and without
+    workers, progress or checkpoints). progress, if given, is called with the number
+    of nonces tried after every chunk; returning False from it cancels the
+    search and mine returns None.
+
+    With checkpoint_dir set, the highest searched nonce is saved there every
+    few seconds (and on cancel), keyed by the header and target, and a mine
+    of the same header picks up from it. checkpoint_meta is stored alongside.
+    """
+    prefix = header_prefix(timestamp, data, prev_hash)
+    target = _target_bytes(difficulty, target)
+    if engine == "numpy":
+        if workers > 1 or progress is not None or checkpoint_dir is not None:
+            raise ValueError("engine='numpy' doesn't support workers, progress or checkpoint_dir")
+        import mining_numpy
+        return mining_numpy.search(prefix, target, start)
+    if engine != "hashlib":
+        raise ValueError(f"unknown mining engine {engine!r}")
+
+    path = None
+    if checkpoint_dir is not None:
+        path = checkpoint_path(checkpoint_dir, prefix, target)
+        saved = load_checkpoint(path)
+        if saved is not None:
+            start = max(start, saved['nonce'])
+        progress = _checkpointing(progress, path, start, checkpoint_meta)
+
+    if workers > 1:
+        result = mine_parallel(prefix, target, workers, start, progress)
+    elif progress is None:
+        result = search(prefix, target, start)
+    else:
+        result = _search_chunked(prefix, target, start, progress)
+
+    if result is not None and path is not None and os.path.exists(path):
+        os.remove(path)
+    return result
+
+def _target_bytes(difficulty, target):
+    return difficulty_target(difficulty) if target is None else target.to_bytes(32, "big")
+
+def _search_chunked(prefix, target, start, progress):
+    lo = start
+    while True:
+        result = search(prefix, target, lo, lo + CHUNK_SIZE)
+        if result is not None:
+            progress(result[0] - start + 1)
+            return result
+        lo += CHUNK_SIZE
+        if progress(lo - start) is False:
+            return None
+
+# ---- checkpoints ----
+
+def checkpoint_path(directory, prefix, target):
+    key = hashlib.sha256(prefix + b"|" + target).hexdigest()
+    return os.path.join(directory, key + ".json")
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(path, nonce, meta=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({'nonce': nonce, 'meta': meta}, f)
+    os.replace(tmp, path)
+
+def list_checkpoints(directory):
+    """All readable checkpoints in directory as (path, checkpoint) pairs"""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            path = os.path.join(directory, name)
+            saved = load_checkpoint(path)
+            if saved is not None:
+                found.append((path, saved))
+    return found
+
+def header_checkpoint(directory, timestamp, data, prev_hash, difficulty=None, target=None):
+    """Path of the checkpoint mine() keeps for this header"""
+    return checkpoint_path(directory, header_prefix(timestamp, data, prev_hash),
+                           _target_bytes(difficulty, target))
+
+def discard_checkpoint(directory, timestamp, data, prev_hash, difficulty=None, target=None):
+    """Remove the checkpoint of a header that will never be mined again"""
+    path = header_checkpoint(directory, timestamp, data, prev_hash, difficulty, target)
+    if os.path.exists(path):
+        os.remove(path)
+
+def claim_checkpoint(path):
+    """Lock a checkpoint for this process; returns the lock, or None if another process holds it.
+
+    Worker processes sharing a checkpoint dir claim a checkpoint before
+    mining it, so each one is resumed once. The lock goes when the process
+    does, so a crashed worker's checkpoints can be claimed again.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock = open(path + ".lock", "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+    return lock
+
+def release_checkpoint(lock):
+    # Whoever grabs the lock file as it goes re-checks that the checkpoint still exists
+    try:
+        os.remove(lock.name)
+    except OSError:
+        pass
+    lock.close()
+
+def _checkpointing(progress, path, start, meta):
+    """Wrap a progress callback so it also writes the searched nonce to disk"""
+    last = time.monotonic()
+
+    def wrapped(tried):
+        nonlocal last
+        keep_going = progress(tried) if progress is not None else None
+        now = time.monotonic()
+        if keep_going is False or now - last >= CHECKPOINT_INTERVAL:
+            save_checkpoint(path, start + tried, meta)
+            last = now
+        return keep_going
+
+    return wrapped
+
+# ---- multi-process search ----
+
+_pools = {}
+_pools_lock = threading.Lock()
+_job = None
+_found = None  # [job id, lowest chunk with a hit or -1], so a late worker can't touch the next job
+
+def _init_worker(job, found):
+    global _job, _found
+    _job = job
+    _found = found
+
+def _search_chunk(job_id, prefix, target, start, chunk):
+    """Scan one nonce range; give up early once the job is over or a lower chunk has a hit"""
+    first = start + chunk * CHUNK_SIZE
+    for lo in range(first, first + CHUNK_SIZE, CHECK_EVERY):
+        if _job.value != job_id:
+            return None
+        with _found.get_lock():
+            if _found[0] == job_id and 0 <= _found[1] < chunk:
+                return None
+        result = search(prefix, target, lo, lo + CHECK_EVERY)
+        if result is not None:
+            with _found.get_lock():
+                # Only record the hit if our job is still the current one
+                if _job.value == job_id and _found[0] == job_id and (_found[1] < 0 or chunk < _found[1]):
+                    _found[1] = chunk
+            return result
+    return None
+
+def get_pool(workers):
+    """Return a long-lived process pool for the given worker count"""
+    with _pools_lock:
+        if workers not in _pools:
+            job = multiprocessing.Value('q', 0)
+            found = multiprocessing.Array('q', [0, -1])
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(job, found))
+            _pools[workers] = (pool, job, found, threading.Lock())
+        return _pools[workers]
+
+def mine_parallel(prefix, target, workers, start=0, progress=None):
+    """Split the nonce space into chunks across a process pool.
+
+    Results are collected in chunk order, so the nonce returned is the lowest
+    valid one, i.e. exactly what the serial loop would have found. A pool
+    serves one search at a time; concurrent callers queue on its lock.
+    """
+    pool, job, found, lock = get_pool(workers)
+    with lock:
+        # Workers record hits under found's lock after checking job, so bump
+        # both under it and no stale hit can land on the new job
+        with found.get_lock():
+            with job.get_lock():
+                job.value += 1
+                job_id = job.value
+            found[0], found[1] = job_id, -1
+
+        pending = deque()
+        next_chunk = 0
+        while len(pending) < workers * 2:
+            pending.append(pool.apply_async(_search_chunk, (job_id, prefix, target, start, next_chunk)))
+            next_chunk += 1
+
+        done = 0
+        while True:
+            result = pending.popleft().get()
+            done += 1
+            if result is not None:
+                if progress is not None:
+                    progress(result[0] - start + 1)
+                break
+            if progress is not None and progress(done * CHUNK_SIZE) is False:
+                break
+            pending.append(pool.apply_async(_search_chunk, (job_id, prefix, target, start, next_chunk)))
+            next_chunk += 1
+
+        # Tell every worker still busy with this job to stop
+        with job.get_lock():
+            job.value += 1
+        return result
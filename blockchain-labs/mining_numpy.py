@@ -0,0 +1,167 @@
+import hashlib
+import numpy as np
+
+import mining
+
+# Batch SHA-256 nonce search over NumPy uint32 arrays.
+#
+# Optional engine for mining.mine(engine="numpy"). A batch is the 10**DIGITS
+# nonces that share everything but their last DIGITS decimal digits, so in
+# the tail block(s) of the message only the words holding those digits
+# change from nonce to nonce. Every word is kept as a plain int while it is
+# the same for the whole batch and only becomes an array once a changing
+# word feeds into it: the header prefix blocks, the message-schedule words
+# built from constant words and the compression rounds before the first
+# changing word are all worked out once per batch instead of per nonce.
+#
+# Nonces below 10**DIGITS are too short to batch and are left to hashlib.
+#
+# This is a demonstration of batch hashing, not a speedup: even with the
+# constant folding it runs at best level with, and usually a little slower
+# than, the hashlib kernel in mining.py on one core (bench_mining.py
+# compares them), since every
+# SHA-256 operation is still a separate pass over the batch. For real
+# speed use mine(workers=N).
+
+K = [
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+]
+
+H0 = [0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19]
+
+DIGITS = 4  # 10**4 nonces a batch keeps the arrays in cache
+MASK = 0xffffffff
+
+# Each word below is an int (same for every nonce) or a uint32 array (one per nonce)
+
+def _rotr(x, n):
+    if type(x) is int:
+        return ((x >> n) | (x << (32 - n))) & MASK
+    return (x >> np.uint32(n)) | (x << np.uint32(32 - n))
+
+def _add(*xs):
+    # Constants are summed as ints first, so only arrays wrap around
+    const = 0
+    total = None
+    owned = False  # total is a new array we may add into in place
+    for x in xs:
+        if type(x) is int:
+            const += x
+        elif total is None:
+            total = x
+        elif owned:
+            total += x
+        else:
+            total = total + x
+            owned = True
+    if total is None:
+        return const & MASK
+    if not const:
+        return total
+    if owned:
+        total += np.uint32(const & MASK)
+        return total
+    return total + np.uint32(const & MASK)
+
+def compress(state, words):
+    """One SHA-256 compression of 16 words into an 8-word state"""
+    w = list(words)
+    for t in range(16, 64):
+        s0 = _rotr(w[t - 15], 7) ^ _rotr(w[t - 15], 18) ^ (w[t - 15] >> 3)
+        s1 = _rotr(w[t - 2], 17) ^ _rotr(w[t - 2], 19) ^ (w[t - 2] >> 10)
+        w.append(_add(w[t - 16], s0, w[t - 7], s1))
+
+    a, b, c, d, e, f, g, h = state
+    for t in range(64):
+        # ch and maj rewritten to take one operation fewer each
+        t1 = _add(h, _rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25), g ^ (e & (f ^ g)), K[t], w[t])
+        t2 = _add(_rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22), (a & b) | (c & (a | b)))
+        h, g, f, e, d, c, b, a = g, f, e, _add(d, t1), c, b, a, _add(t1, t2)
+    return [_add(s, x) for s, x in zip(state, (a, b, c, d, e, f, g, h))]
+
+def _words(data):
+    return [int.from_bytes(data[i:i + 4], "big") for i in range(0, len(data), 4)]
+
+def midstate(prefix):
+    """Compress every full 64-byte block of the prefix; returns (state, leftover bytes)"""
+    full = len(prefix) // 64 * 64
+    state = H0
+    for i in range(0, full, 64):
+        state = compress(state, _words(prefix[i:i + 64]))
+    return state, prefix[full:]
+
+_low_digits = {}
+
+def low_digits(digits):
+    """ASCII codes of each of the `digits` digits of 0 .. 10**digits - 1, most significant first"""
+    if digits not in _low_digits:
+        n = np.arange(10 ** digits, dtype=np.uint32)
+        _low_digits[digits] = [(n // np.uint32(10 ** (digits - 1 - j)) % np.uint32(10) + np.uint32(48))
+                               for j in range(digits)]
+    return _low_digits[digits]
+
+def hash_batch(state, rest, total_len, high, digits=DIGITS):
+    """Digests of prefix + high + every `digits`-digit suffix 0...0 to 9...9, in that order.
+
+    state/rest come from midstate(prefix), total_len is len(prefix) and
+    high is the shared leading part of the nonces as a string. Returns the
+    8 digest words.
+    """
+    fixed = rest + high.encode()
+    tail_len = len(fixed) + digits
+    padded = bytearray((tail_len + 9 + 63) // 64 * 64)
+    padded[:len(fixed)] = fixed
+    padded[tail_len] = 0x80
+    padded[-8:] = ((total_len + len(high) + digits) * 8).to_bytes(8, "big")
+
+    low = low_digits(digits)
+    words = _words(padded)
+    for j in range(digits):
+        pos = len(fixed) + j
+        shifted = low[j] << np.uint32(24 - pos % 4 * 8)
+        words[pos // 4] = shifted | words[pos // 4]
+    for i in range(0, len(words), 16):
+        state = compress(state, words[i:i + 16])
+    return state
+
+def search(prefix, target, start=0, stop=None, digits=DIGITS):
+    """Same contract as mining.search, evaluated 10**digits nonces at a time"""
+    size = 10 ** digits
+    if start < size:
+        found = mining.search(prefix, target, start, size if stop is None else min(stop, size))
+        if found is not None or (stop is not None and stop <= size):
+            return found
+        start = size
+
+    state, rest = midstate(prefix)
+    limit = int.from_bytes(target, "big")
+    base = start - start % size
+    while stop is None or base < stop:
+        words = hash_batch(state, rest, len(prefix), str(base // size), digits)
+        # Only nonces whose first digest word is low enough can be under the target
+        for i in np.flatnonzero(words[0] <= np.uint32(limit >> 224)):
+            nonce = base + int(i)
+            if nonce < start or (stop is not None and nonce >= stop):
+                continue
+            digest = b"".join(int(w if isinstance(w, int) else w[i]).to_bytes(4, "big") for w in words)
+            if int.from_bytes(digest, "big") <= limit:
+                return nonce, digest.hex()
+        base += size
+    return None
+
+if __name__ == "__main__":
+    # Quick manual check; tests/test_mining_numpy.py covers this properly
+    prefix = mining.header_prefix(1700000000.5, "numpy engine", "0" * 64)
+    state, rest = midstate(prefix)
+    words = hash_batch(state, rest, len(prefix), "123", 3)
+    for low in (0, 7, 999):
+        expected = hashlib.sha256(prefix + b"123%03d" % low).digest()
+        assert b"".join(int(w[low]).to_bytes(4, "big") for w in words) == expected
+    print("NumPy engine matches hashlib")
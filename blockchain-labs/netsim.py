@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import copy
+import json
+import os
+import platform
+import random
+import sys
+import time
+import types
+from collections import Counter
+
+import bench_suite
+import network
+
+# Simulates block propagation between N lab12/lab13 nodes.
+#
+# Every node is a real Blockchain from lab12 or lab13 with its own inbox
+# coroutine. Messages go over simulated links with latency, jitter, loss
+# and bandwidth. Blocks are gossiped to `fanout` random peers. A block
+# that doesn't fit the receiver's tip makes it ask the sender for its
+# chain, using the same fork choice as network.py. Every node also sends
+# its tip to one random peer every --anti-entropy seconds, so lost
+# messages get repaired.
+#
+# Time is simulated. The event loop jumps straight to the next timer, so a
+# run takes as long as its hashing, and the same seed gives the same JSON.
+#
+#   python netsim.py --lab lab13 --nodes 100 --sync suffix,full -o sim.json
+
+EPOCH = 1700000000.0
+STATUS_BYTES = 100  # node id, chain length and tip hash, with framing
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    """Event loop on simulated time: when nothing is ready the clock jumps to the next timer"""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def _run_once(self):
+        if not self._ready and self._scheduled:
+            self.now = max(self.now, self._scheduled[0].when())
+        super()._run_once()
+
+class Lab:
+    def __init__(self, name, difficulty):
+        self.name = name
+        self.module = bench_suite.load("sim_" + name, os.path.join(name, "blockchain.py"))
+        # difficulty is in leading hex zeros, as in bench_suite; lab12 takes bits
+        self.difficulty = difficulty if name == "lab13" else 4 * difficulty
+
+    def new_chain(self):
+        return self.module.Blockchain(difficulty=self.difficulty)
+
+    def shared(self, chain, peer):
+        """How many leading blocks chain has in common with peer's"""
+        if self.name == "lab12":
+            return chain.common_prefix(peer)
+        return network.shared_prefix(chain.chain, peer.chain)
+
+    def adopt(self, chain, peer, same):
+        if self.name == "lab12":
+            chain.sync_from(peer)
+        else:
+            chain.sync_from(chain.chain[:same] + peer.chain[same:])
+
+def better(length, tip, other_length, other_tip):
+    """network.py's fork choice: longer chain wins, then the lower tip hash"""
+    return (length, other_tip) > (other_length, tip)
+
+class Simulation:
+    def __init__(self, lab, args, sync):
+        self.lab = lab
+        self.args = args
+        self.sync = sync  # "suffix": send blocks after the common prefix; "full": the whole chain
+        self.rng = random.Random(args.seed)
+        self.bytes = 0
+        self.messages = 0
+        self.block_bytes = {}
+        self.mined = {}     # digest -> time mined
+        self.holders = Counter()  # digest -> nodes that have had it
+        self.reached = {}   # digest -> time every node had it
+        self.pending = {}   # node -> peer asked for its chain
+        self.tips = []
+        self.tip_counts = Counter()
+        self.mining_done = None  # time the last block was mined
+
+    def size(self, block):
+        n = self.block_bytes.get(block.digest)
+        if n is None:
+            n = self.block_bytes[block.digest] = len(json.dumps(block.to_dict()))
+        return n
+
+    def send(self, src, dst, message, nbytes):
+        self.bytes += nbytes
+        self.messages += 1
+        if self.rng.random() < self.args.loss:
+            return
+        delay = self.args.latency + self.rng.uniform(0, self.args.jitter) + nbytes / self.args.bandwidth
+        self.loop.call_later(delay, self.inboxes[dst].put_nowait, (src, message))
+
+    def gossip(self, src, block, skip=None):
+        peers = [i for i in range(len(self.chains)) if i != src and i != skip]
+        for peer in self.rng.sample(peers, min(self.args.fanout, len(peers))):
+            self.send(src, peer, ('block', block), self.size(block))
+
+    def gained(self, node, blocks):
+        """Bookkeeping for blocks node has just added to its chain"""
+        seen = self.seen[node]
+        for block in blocks:
+            if block.digest in seen:
+                continue  # back after a reorg
+            seen.add(block.digest)
+            self.holders[block.digest] += 1
+            if self.holders[block.digest] == len(self.chains):
+                self.reached[block.digest] = self.loop.time()
+        tip = self.chains[node].chain[-1].digest
+        self.tip_counts[self.tips[node]] -= 1
+        self.tip_counts[tip] += 1
+        self.tips[node] = tip
+        if self.mining_done is not None and self.tip_counts[tip] == len(self.chains):
+            self.converged.set()
+
+    def ask(self, node, peer):
+        if node in self.pending:
+            return
+        self.pending[node] = peer
+        chain = self.chains[node].chain
+        nbytes = STATUS_BYTES
+        if self.sync == "suffix":
+            nbytes += 32 * len(chain).bit_length()  # block locator: a hash per power of two back
+        self.send(node, peer, ('getchain', len(chain), chain[-1].hash), nbytes)
+        # Forget the request if the reply is lost
+        self.loop.call_later(self.args.timeout, self._expire, node, peer)
+
+    def _expire(self, node, peer):
+        if self.pending.get(node) == peer:
+            del self.pending[node]
+
+    def handle(self, node, src, message):
+        chain = self.chains[node]
+        kind = message[0]
+        if kind == 'block':
+            block = message[1]
+            if chain.knows(block.hash):
+                return
+            if chain.receive_block(block):
+                self.gained(node, [block])
+                self.gossip(node, block, skip=src)
+            else:
+                self.ask(node, src)
+        elif kind == 'getchain':
+            _, length, tip = message
+            if not better(len(chain.chain), chain.chain[-1].hash, length, tip):
+                # The asker is ahead of us; pull from it instead
+                self.ask(node, src)
+                self.send(node, src, ('chain', None, 0), STATUS_BYTES)
+                return
+            peer = types.SimpleNamespace(chain=list(chain.chain), verified=getattr(chain, 'verified', 0))
+            same = self.lab.shared(self.chains[src], peer) if self.sync == "suffix" else 0
+            nbytes = STATUS_BYTES + sum(self.size(b) for b in peer.chain[same:])
+            self.send(node, src, ('chain', peer, same), nbytes)
+        elif kind == 'chain':
+            _, peer, same = message
+            if self.pending.get(node) == src:
+                del self.pending[node]
+            if peer is None or not better(len(peer.chain), peer.chain[-1].hash,
+                                          len(chain.chain), chain.chain[-1].hash):
+                return
+            # Our chain may have moved on while the reply was in flight
+            same = min(same, self.lab.shared(chain, peer))
+            had = {b.digest for b in chain.chain[same:]}
+            self.lab.adopt(chain, peer, same)
+            self.gained(node, [b for b in chain.chain[same:] if b.digest not in had])
+            self.gossip(node, chain.chain[-1], skip=src)
+
+    async def node(self, i):
+        inbox = self.inboxes[i]
+        while True:
+            src, message = await inbox.get()
+            self.handle(i, src, message)
+
+    async def anti_entropy(self, i):
+        await asyncio.sleep(self.rng.uniform(0, self.args.anti_entropy))
+        while True:
+            peer = self.rng.randrange(len(self.chains) - 1)
+            peer += peer >= i
+            tip = self.chains[i].chain[-1]
+            self.send(i, peer, ('block', tip), self.size(tip))
+            await asyncio.sleep(self.args.anti_entropy)
+
+    async def miner(self):
+        for k in range(self.args.blocks):
+            await asyncio.sleep(self.rng.expovariate(self.args.block_rate))
+            i = self.rng.randrange(len(self.chains))
+            chain = self.chains[i]
+            chain.add_block(f"block {k} by node {i}")
+            block = chain.chain[-1]
+            self.mined[block.digest] = self.loop.time()
+            self.gained(i, [block])
+            self.gossip(i, block)
+        self.mining_done = self.loop.time()
+        if self.tip_counts[self.tips[0]] == len(self.chains):
+            self.converged.set()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.lab.module.clock = lambda: EPOCH + self.loop.time()
+        genesis = self.lab.new_chain()
+        n = self.args.nodes
+        # Blocks are immutable, so every node starts out sharing the genesis block
+        self.chains = [copy.deepcopy(genesis) for _ in range(n)]
+        self.inboxes = [asyncio.Queue() for _ in range(n)]
+        self.tips = [genesis.chain[-1].digest] * n
+        self.tip_counts[self.tips[0]] = n
+        self.holders[genesis.chain[0].digest] = n
+        self.seen = [{genesis.chain[0].digest} for _ in range(n)]
+        self.converged = asyncio.Event()
+
+        tasks = [asyncio.ensure_future(self.node(i)) for i in range(n)]
+        tasks += [asyncio.ensure_future(self.anti_entropy(i)) for i in range(n)]
+        await self.miner()
+        try:
+            await asyncio.wait_for(self.converged.wait(), max(0, self.args.max_time - self.loop.time()))
+        except asyncio.TimeoutError:
+            pass
+        end = self.loop.time()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return self.report(end)
+
+    def report(self, end):
+        # The chain most nodes ended on decides which blocks were orphaned
+        tip = self.tip_counts.most_common(1)[0][0]
+        final = self.chains[self.tips.index(tip)].chain
+        kept = {b.digest for b in final}
+        blocks = len(self.mined)
+        orphans = sum(1 for d in self.mined if d not in kept)
+        reach = sorted(self.reached[d] - t for d, t in self.mined.items() if d in self.reached)
+        converged = self.converged.is_set()
+        return {
+            'converged': converged,
+            'convergence_seconds': end - self.mining_done if converged else None,
+            'simulated_seconds': end,
+            'blocks_mined': blocks,
+            'final_height': len(final) - 1,
+            'orphan_rate': orphans / blocks if blocks else 0.0,
+            'bytes': self.bytes,
+            'bytes_per_block': self.bytes / blocks if blocks else None,
+            'messages': self.messages,
+            'messages_per_block': self.messages / blocks if blocks else None,
+            'propagation_p50_seconds': percentile(reach, 0.5),
+            'propagation_p90_seconds': percentile(reach, 0.9),
+        }
+
+def percentile(values, q):
+    return values[int(q * (len(values) - 1))] if values else None
+
+def simulate(lab, args, sync):
+    loop = VirtualLoop()
+    try:
+        return loop.run_until_complete(Simulation(lab, args, sync).run())
+    finally:
+        loop.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated block propagation between lab12/lab13 nodes")
+    parser.add_argument("--lab", choices=["lab12", "lab13"], default="lab13")
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--blocks", type=int, default=50, help="blocks mined over the run")
+    parser.add_argument("--block-rate", type=float, default=1.0, help="blocks per second, network-wide")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per link")
+    parser.add_argument("--jitter", type=float, default=0.05, help="extra 0..jitter seconds per message")
+    parser.add_argument("--bandwidth", type=float, default=1e6, help="bytes per second per link")
+    parser.add_argument("--loss", type=float, default=0.0, help="chance each message is dropped")
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--anti-entropy", type=float, default=1.0, help="seconds between tip exchanges")
+    parser.add_argument("--timeout", type=float, default=2.0, help="seconds before a chain request is given up")
+    parser.add_argument("--max-time", type=float, default=600.0, help="simulated seconds before giving up")
+    parser.add_argument("--difficulty", type=int, default=1, help="leading hex zeros")
+    parser.add_argument("--sync", type=lambda s: s.split(","), default=["suffix"],
+                        help="comma-separated strategies to compare: suffix, full")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="write results here instead of stdout")
+    args = parser.parse_args()
+
+    lab = Lab(args.lab, args.difficulty)
+    results = {}
+    for sync in args.sync:
+        start = time.perf_counter()
+        results[sync] = simulate(lab, args, sync)
+        print(f"== {sync}: {time.perf_counter() - start:.1f} s wall", file=sys.stderr)
+
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "sync")}
+    report = {'meta': {'python': platform.python_version(), **params}, 'results': results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import argparse
+import atexit
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Run lab12/lab13 nodes as separate processes on localhost.
+#
+# Each node (lab12/node.py, lab13/node.py) owns one Blockchain and serves a
+# small JSON API over HTTP. New blocks spread by gossip: a node queues the
+# blocks it mines or accepts and, every `interval` seconds, sends the whole
+# batch to `fanout` random peers. A block that doesn't extend the receiver's
+# tip means it is behind or on a fork, so it pulls from the sender instead
+# if the sender's chain is the better one (longer, or as long with a lower
+# tip hash), and otherwise sends its own tip back to the sender.
+#
+# The Flask apps become dashboards over the nodes: RemoteNode stands in for
+# a Blockchain there and turns each call into a request to the node.
+
+TIMEOUT = 10
+
+def request(url, payload=None):
+    """GET (or POST with a JSON payload) url and decode the JSON reply"""
+    data = None if payload is None else json.dumps(payload).encode()
+    req = urllib.request.Request(url, data, {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+        return json.loads(resp.read())
+
+def node_ids(count):
+    if count <= 26:
+        return [chr(ord("A") + i) for i in range(count)]
+    return [f"N{i}" for i in range(count)]
+
+def shared_prefix(chain, peer_chain, window=64):
+    """Length of the prefix two chains share, walking back from the shorter tip.
+
+    Trusts that matching hashes mean matching history below them, which
+    holds for lab13, where a tamper re-mines everything after it.
+    """
+    n = min(len(chain), len(peer_chain))
+    while n > 0:
+        start = max(0, n - window)
+        theirs = peer_chain[start:n]
+        for h in range(n - 1, start - 1, -1):
+            if chain[h].digest == theirs[h - start].digest:
+                return h + 1
+        n = start
+    return 0
+
+class RemoteChain:
+    """Read-only list view of a node's chain; every access is a request"""
+
+    def __init__(self, url, block_cls):
+        self.url = url
+        self.block_cls = block_cls
+
+    def __len__(self):
+        return request(self.url + "/status")['length']
+
+    def _fetch(self, start, stop):
+        blocks = request(f"{self.url}/blocks?start={start}&stop={stop}")
+        return [self.block_cls.from_dict(b) for b in blocks]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self._fetch(start, stop)[::step]
+        if index < 0:
+            index += len(self)
+        blocks = self._fetch(index, index + 1) if index >= 0 else []
+        if not blocks:
+            raise IndexError("block index out of range")
+        return blocks[0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+class RemoteNode:
+    """Blockchain stand-in for the dashboards, backed by a node process"""
+
+    def __init__(self, url, block_cls):
+        self.url = url
+        self.chain = RemoteChain(url, block_cls)
+
+    def status(self):
+        return request(self.url + "/status")
+
+    @property
+    def verified(self):
+        return self.status()['verified']
+
+    def is_valid(self):
+        return request(self.url + "/status?valid=1")['valid']
+
+    def block_range(self, start, stop):
+        return self.chain[max(0, start):max(0, stop)]
+
+    def add_block(self, data):
+        request(self.url + "/add", {'data': data})
+
+    def tamper_block(self, index, new_data):
+        request(self.url + "/tamper", {'index': index, 'data': new_data})
+
+    def sync_from(self, peer):
+        """Have the node pull from peer (a RemoteNode or RemoteChain)"""
+        request(self.url + "/sync", {'peer': peer.url})
+
+    def to_hash_list(self):
+        return request(self.url + "/hashes")
+
+    def fingerprint(self):
+        return tuple(self.status()['fingerprint'])
+
+    def chain_work(self):
+        return self.status()['work']
+
+    def _get(self, path):
+        try:
+            return request(self.url + path)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def get_block(self, block_hash):
+        found = self._get(f"/block/{block_hash}")
+        return None if found is None else self.chain.block_cls.from_dict(found['block'])
+
+    def height_of(self, block_hash):
+        found = self._get(f"/block/{block_hash}")
+        return None if found is None else found['height']
+
+    def inclusion_proof(self, block_index, entry_index):
+        return request(f"{self.url}/proof/{block_index}/{entry_index}")['proof']
+
+    def verify_inclusion(self, block_index, entry, proof):
+        return request(self.url + "/verify", {'index': block_index, 'entry': entry, 'proof': proof})['verified']
+
+class NodeServer:
+    """One node: a Blockchain behind an HTTP API, plus the gossip sender"""
+
+    def __init__(self, node_id, blockchain, block_cls, port, peers, catch_up, fanout=3, interval=0.2):
+        self.node_id = node_id
+        self.blockchain = blockchain
+        self.block_cls = block_cls
+        self.url = f"http://127.0.0.1:{port}"
+        self.peers = peers
+        self.catch_up = catch_up  # catch_up(blockchain, RemoteNode) pulls from a longer peer
+        self.fanout = fanout
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.outbox = []  # block dicts waiting for the next gossip round
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+
+    def serve_forever(self):
+        threading.Thread(target=self._gossip_loop, daemon=True).start()
+        self.httpd.serve_forever()
+
+    def _gossip_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                batch, self.outbox = self.outbox, []
+            if not batch:
+                continue
+            message = {'from': self.url, 'blocks': batch}
+            for peer in random.sample(self.peers, min(self.fanout, len(self.peers))):
+                try:
+                    request(peer + "/gossip", message)
+                except OSError:
+                    pass  # peer down or busy; others will pass the blocks on
+
+    def receive(self, sender, blocks):
+        """Take a gossip batch; returns how many blocks were new to us"""
+        accepted = []
+        reply = None
+        with self.lock:
+            chain = self.blockchain
+            for data in blocks:
+                if chain.knows(data['hash']):
+                    continue
+                if not chain.receive_block(self.block_cls.from_dict(data)):
+                    break
+                accepted.append(data)
+            else:
+                self.outbox.extend(accepted)
+                return len(accepted)
+            # A block didn't fit our tip: we're behind or on a fork. Longest
+            # chain wins, ties go to the lower tip hash so every node picks the same one
+            peer = RemoteNode(sender, self.block_cls)
+            theirs = peer.status()
+            before = len(chain.chain)
+            if (theirs['length'], chain.chain[-1].hash) > (before, theirs['tip']):
+                self.catch_up(chain, peer)
+                accepted = blocks
+            elif theirs['tip'] != chain.chain[-1].hash:
+                # We win: hand the sender our tip so it catches up from us
+                reply = {'from': self.url, 'blocks': [chain.chain[-1].to_dict()]}
+            self.outbox.extend(accepted)
+            added = len(chain.chain) - before
+        # Outside the lock: the sender may be waiting on ours to send to us
+        if reply is not None:
+            try:
+                request(sender + "/gossip", reply)
+            except OSError:
+                pass
+        return added
+
+    def status(self, valid=False):
+        # Validity is only worked out when asked for; it can rehash a lot of blocks
+        chain = self.blockchain
+        status = {
+            'id': self.node_id,
+            'length': len(chain.chain),
+            'tip': chain.chain[-1].hash,
+            'verified': getattr(chain, 'verified', 0)
+        }
+        if hasattr(chain, 'fingerprint'):
+            status['fingerprint'] = chain.fingerprint()
+            status['work'] = chain.chain_work()
+        if valid:
+            status['valid'] = chain.is_valid()
+        return status
+
+    def get(self, path, query):
+        chain = self.blockchain
+        parts = path.strip("/").split("/")
+        if path == "/status":
+            return self.status('valid' in query)
+        if path == "/blocks":
+            start = int(query.get('start', ['0'])[0])
+            stop = int(query.get('stop', [str(len(chain.chain))])[0])
+            return [b.to_dict() for b in chain.block_range(start, stop)]
+        if path == "/hashes":
+            return chain.to_hash_list() if hasattr(chain, 'to_hash_list') else [b.hash for b in chain.chain]
+        if parts[0] == "block" and len(parts) == 2:
+            block = chain.get_block(parts[1])
+            return None if block is None else {'height': chain.height_of(parts[1]), 'block': block.to_dict()}
+        if parts[0] == "proof" and len(parts) == 3:
+            b, e = int(parts[1]), int(parts[2])
+            if not 0 <= b < len(chain.chain) or not 0 <= e < len(chain.chain[b].entries):
+                return None
+            return {'proof': chain.inclusion_proof(b, e)}
+        return None
+
+    def post(self, path, body):
+        chain = self.blockchain
+        if path == "/gossip":
+            return {'accepted': self.receive(body['from'], body['blocks'])}
+        if path == "/add":
+            with self.lock:
+                chain.add_block(body['data'])
+                self.outbox.append(chain.chain[-1].to_dict())
+            return self.status()
+        if path == "/tamper":
+            with self.lock:
+                chain.tamper_block(body['index'], body['data'])
+            return self.status()
+        if path == "/sync":
+            with self.lock:
+                self.catch_up(chain, RemoteNode(body['peer'], self.block_cls))
+            return self.status()
+        if path == "/verify":
+            return {'verified': chain.verify_inclusion(body['index'], body['entry'], body['proof'])}
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, result):
+                body = json.dumps(result).encode()
+                self.send_response(404 if result is None else 200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                self._reply(server.get(url.path, parse_qs(url.query)))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._reply(server.post(self.path, json.loads(self.rfile.read(length) or b"{}")))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def node_args():
+    parser = argparse.ArgumentParser(description="Run one blockchain node")
+    parser.add_argument("--id", required=True)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--peers", default="", help="comma-separated peer URLs")
+    parser.add_argument("--difficulty", type=int)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds between gossip rounds")
+    args = parser.parse_args()
+    args.peers = [p for p in args.peers.split(",") if p]
+    return args
+
+def start_network(script, count, block_cls, base_port=7100, extra_args=()):
+    """Launch `count` node processes running script; returns {id: RemoteNode}"""
+    ids = node_ids(count)
+    urls = [f"http://127.0.0.1:{base_port + i}" for i in range(count)]
+    procs = []
+    for i, node_id in enumerate(ids):
+        peers = ",".join(u for u in urls if u != urls[i])
+        procs.append(subprocess.Popen([sys.executable, script, "--id", node_id, "--port", str(base_port + i),
+                                       "--peers", peers, *extra_args]))
+    atexit.register(lambda: [p.terminate() for p in procs])
+
+    nodes = {node_id: RemoteNode(url, block_cls) for node_id, url in zip(ids, urls)}
+    deadline = time.time() + 60
+    for node_id, node in nodes.items():
+        while True:
+            try:
+                node.status()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError(f"node {node_id} at {node.url} didn't start")
+                time.sleep(0.1)
+    return nodes
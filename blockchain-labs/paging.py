@@ -0,0 +1,26 @@
+# Cursor pagination for the lab web UIs (lab11, lab12, lab13).
+#
+# Pages show the newest blocks first. The cursor is a height, "the blocks
+# below this one", so a page doesn't shift when blocks are added at the tip
+# and rendering one costs the same however long the chain gets.
+
+PAGE_SIZE = 20
+
+def page(length, before=None, size=PAGE_SIZE):
+    """Heights [start, stop) to show, plus the cursors for the older/newer pages"""
+    stop = length if before is None else min(before, length)
+    if stop <= 0:
+        stop = min(size, length)
+    start = max(0, stop - size)
+    return {
+        'start': start,
+        'stop': stop,
+        'length': length,
+        'older': start or None,
+        'newer': stop + size if stop < length else None
+    }
+
+def newest_first(blockchain, p):
+    """(height, block) pairs for page p, tip end first"""
+    blocks = blockchain.block_range(p['start'], p['stop'])
+    return [(p['start'] + i, block) for i, block in enumerate(blocks)][::-1]
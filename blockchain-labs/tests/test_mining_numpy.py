@@ -0,0 +1,54 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+
+import mining
+import mining_numpy
+
+def digest(words, i):
+    return b"".join(int(w if isinstance(w, int) else w[i]).to_bytes(4, "big") for w in words)
+
+@pytest.mark.parametrize("length", [0, 1, 47, 51, 52, 55, 56, 63, 64, 100, 119, 120, 128, 200])
+def test_hash_batch_matches_hashlib(length):
+    # Covers the tail fitting in one block, spilling into two and a full prefix block
+    prefix = bytes(range(length % 256))[:length] + b"x" * max(0, length - 256)
+    state, rest = mining_numpy.midstate(prefix)
+    for high in ("1", "12345"):
+        words = mining_numpy.hash_batch(state, rest, len(prefix), high, 3)
+        for low in (0, 1, 9, 10, 99, 100, 998, 999):
+            expected = hashlib.sha256(prefix + b"%s%03d" % (high.encode(), low)).digest()
+            assert digest(words, low) == expected
+
+@pytest.mark.parametrize("difficulty", [2, 3, 4])
+def test_search_matches_hashlib(difficulty):
+    prefix = mining.header_prefix(1700000000.5, f"numpy {difficulty}", "0" * 64)
+    target = mining.difficulty_target(difficulty)
+    for start in (0, 9999, 10000, 12345, 10 ** 6 + 7):
+        assert mining_numpy.search(prefix, target, start) == mining.search(prefix, target, start)
+
+def test_search_respects_stop():
+    prefix = mining.header_prefix(1700000000.5, "stop", "0" * 64)
+    target = mining.difficulty_target(3)
+    nonce, _ = mining.search(prefix, target, 20000)
+    assert mining_numpy.search(prefix, target, 20000, nonce) is None
+    assert mining_numpy.search(prefix, target, 20000, nonce + 1) == mining.search(prefix, target, 20000)
+    assert mining_numpy.search(prefix, target, 5000, 10000) == mining.search(prefix, target, 5000, 10000)
+
+def test_mine_numpy_engine():
+    expected = mining.mine(1700000000.5, "engine", "0" * 64, difficulty=3)
+    assert mining.mine(1700000000.5, "engine", "0" * 64, difficulty=3, engine="numpy") == expected
+
+@pytest.mark.parametrize("option", [{'workers': 2}, {'progress': lambda n: True}, {'checkpoint_dir': "/tmp"}])
+def test_mine_numpy_rejects_unsupported_options(option):
+    with pytest.raises(ValueError):
+        mining.mine(1700000000.5, "engine", "0" * 64, difficulty=3, engine="numpy", **option)
+
+def test_mine_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        mining.mine(1700000000.5, "engine", "0" * 64, difficulty=3, engine="cuda")
@@ -0,0 +1,74 @@
+import hashlib
+import multiprocessing
+import os
+import merkle
+
+# Parallel full-chain validation for the lab12/lab13 chains.
+#
+# Each block's hash can be recomputed on its own, so the chain is cut into
+# index ranges that are hashed in a process pool. A range also checks the
+# link from its first block back to the last block of the range before it,
+# so nothing is missed at the boundaries. Ranges are read back in order, so
+# the first bad range gives the first invalid index overall.
+#
+# Nothing is shared between calls: every pool gets its own headers through
+# its initializer, so validations on different threads don't mix.
+
+MIN_PARALLEL = 5000  # below this the pool start-up costs more than it saves
+
+_worker_headers = None  # (headers, base), only ever set inside a pool worker
+
+def _headers(chain, start):
+    return [(b.timestamp, b.entries, b.prev_hash, b.nonce, b.hash) for b in chain[start - 1:]]
+
+def _check(headers, base, lo, hi):
+    """First invalid index in [lo, hi), or None; headers[0] is the block at base"""
+    for i in range(lo, hi):
+        timestamp, entries, prev_hash, nonce, h = headers[i - base]
+        if prev_hash != headers[i - 1 - base][4]:
+            return i
+        root = merkle.merkle_root(entries)
+        if hashlib.sha256(f"{timestamp}{root}{prev_hash}{nonce}".encode()).hexdigest() != h:
+            return i
+    return None
+
+def _init_worker(headers, base):
+    global _worker_headers
+    _worker_headers = headers, base
+
+def _check_range(args):
+    lo, hi, headers, base = args
+    if headers is None:
+        headers, base = _worker_headers
+    return _check(headers, base, lo, hi)
+
+def first_invalid(chain, workers=None, chunk_size=None, start=1):
+    """Index of the first block from start on with a bad hash or link, or None.
+
+    Blocks before start are taken as already checked; start=1 checks
+    everything after genesis.
+    """
+    n = len(chain)
+    if start >= n:
+        return None
+    headers = _headers(chain, start)
+    base = start - 1
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or n - start < MIN_PARALLEL:
+        return _check(headers, base, start, n)
+
+    chunk_size = chunk_size or -(-(n - start) // (workers * 4))
+    ranges = [(lo, min(lo + chunk_size, n)) for lo in range(start, n, chunk_size)]
+    if "fork" in multiprocessing.get_all_start_methods():
+        # Forked workers inherit the initializer's headers, so only the bounds are sent
+        pool = multiprocessing.get_context("fork").Pool(workers, _init_worker, (headers, base))
+        tasks = [(lo, hi, None, 0) for lo, hi in ranges]
+    else:
+        pool = multiprocessing.get_context().Pool(workers)
+        tasks = [(lo, hi, headers[lo - 1 - base:hi - base], lo - 1) for lo, hi in ranges]
+
+    with pool:
+        for bad in pool.imap(_check_range, tasks):
+            if bad is not None:
+                return bad
+    return None